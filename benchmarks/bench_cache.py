@@ -0,0 +1,59 @@
+"""
+Compare cold (parse and write cache) and warm (load cache) times
+
+    $ python -m benchmarks.bench_cache \
+        --data tests/fixtures/sample_iostat.output
+"""
+import argparse
+import shutil
+import tempfile
+import time
+
+from iostat.main import parse_argument as parse_iostat_argument
+from iostat.parser import Parser
+
+
+def parse_argument():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        '--data', action='store', required=True,
+        help='set path to iostat output file',
+    )
+    parser.add_argument(
+        '--mmap', action='store_true',
+        help='parse with memory-mapped bytes on cold run',
+    )
+    return parser.parse_args()
+
+
+def load(argv):
+    args = parse_iostat_argument(argv)
+    start = time.perf_counter()
+    store = Parser(args).load()
+    # touch all of the values to include reading from the cache file
+    store.device_table()[2].sum()
+    return store, time.perf_counter() - start
+
+
+def main():
+    args = parse_argument()
+    cache_dir = tempfile.mkdtemp()
+    try:
+        argv = ['--data', args.data, 'csv', '--cache-dir', cache_dir]
+        if args.mmap:
+            argv.append('--mmap')
+        _, no_cache = load(argv[:3] + argv[5:])
+        store, cold = load(argv)
+        _, warm = load(argv)
+    finally:
+        shutil.rmtree(cache_dir)
+
+    print('snapshots: %d, device entries: %d' % (
+        len(store), len(store.device_rows)))
+    print('%-12s %8.3f sec' % ('no cache', no_cache))
+    print('%-12s %8.3f sec' % ('cold', cold))
+    print('%-12s %8.3f sec' % ('warm', warm))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+"""
+Compare memory usage of the columnar StatStore with a list of
+per-snapshot dicts (the layout used by older versions)
+
+    $ python -m benchmarks.bench_memory \
+        --data tests/fixtures/sample_iostat.output
+"""
+import argparse
+import tracemalloc
+
+from iostat.main import parse_argument as parse_iostat_argument
+from iostat.parser import Parser
+
+
+def parse_argument():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        '--data', action='store', required=True,
+        help='set path to iostat output file',
+    )
+    args = parser.parse_args()
+    return parse_iostat_argument(['--data', args.data, 'csv'])
+
+
+def measure(func):
+    tracemalloc.start()
+    result = func()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, current, peak
+
+
+def main():
+    args = parse_argument()
+    store, store_current, store_peak = measure(Parser(args).load)
+    stats, dict_current, dict_peak = measure(lambda: list(store.iter_stats()))
+
+    print('snapshots: %d, device entries: %d' % (
+        len(store), len(store.device_rows)))
+    print('%-16s %14s %14s' % ('layout', 'retained [KiB]', 'peak [KiB]'))
+    print('%-16s %14.1f %14.1f' % (
+        'StatStore', store_current / 1024, store_peak / 1024))
+    print('%-16s %14.1f %14.1f' % (
+        'list of dicts', dict_current / 1024, dict_peak / 1024))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""
+Measure the line classifier and the parse throughput on
+tests/fixtures/sample_iostat.output scaled up to a given size
+
+    $ python -m benchmarks.bench_tokenizer --size 1024
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+import timeit
+
+from iostat.main import parse_argument as parse_iostat_argument
+from iostat.parser import Parser
+from iostat.tokenizer import Tokenizer
+from iostat.utils import get_iostat_date_format
+from iostat.utils import parse_datetime
+
+FIXTURE = os.path.join(
+    os.path.dirname(__file__), '..', 'tests', 'fixtures',
+    'sample_iostat.output',
+)
+
+
+def parse_argument():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        '--size', action='store', type=int, default=1024,
+        help='set size of the scaled log in MiB, default is 1024',
+    )
+    parser.add_argument(
+        '--number', action='store', type=int, default=10,
+        help='set number of loops for the classifier benchmark',
+    )
+    return parser.parse_args()
+
+
+def regex_classify(line):
+    line = line.strip()
+    date_format = get_iostat_date_format(line)
+    if date_format is not None:
+        return parse_datetime(line, fmt=date_format)
+    return line
+
+
+def bench_classifier(lines, number):
+    tokenizer = Tokenizer()
+    results = [
+        ('regex+strptime', lambda: [regex_classify(i) for i in lines]),
+        ('tokenizer', lambda: [tokenizer.tokenize(i) for i in lines]),
+    ]
+    for name, func in results:
+        elapsed = timeit.timeit(func, number=number)
+        usec = elapsed / (number * len(lines)) * 1e6
+        print('%-16s %8.3f usec/line' % (name, usec))
+
+
+def make_scaled_log(path, size):
+    with open(FIXTURE, 'rb') as f:
+        data = f.read()
+    with open(path, 'wb') as f:
+        written = 0
+        while written < size:
+            f.write(data)
+            written += len(data)
+    return written
+
+
+def bench_parse(size):
+    tmpdir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmpdir, 'scaled_iostat.output')
+        written = make_scaled_log(path, size)
+        args = parse_iostat_argument(['--data', path, 'csv'])
+        start = time.perf_counter()
+        store = Parser(args).load()
+        elapsed = time.perf_counter() - start
+    finally:
+        shutil.rmtree(tmpdir)
+
+    mib = written / 1024 / 1024
+    print('parsed %.1f MiB (%d snapshots) in %.2f sec: %.1f MiB/sec' % (
+        mib, len(store), elapsed, mib / elapsed))
+
+
+def main():
+    args = parse_argument()
+    with open(FIXTURE) as f:
+        # lines outside of stat blocks go through the classifier
+        lines = [i for i in f if not i.startswith(('sd', ' '))]
+    bench_classifier(lines, args.number)
+    bench_parse(args.size * 1024 * 1024)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,191 @@
+import argparse
+import hashlib
+import json
+import os
+import struct
+import tempfile
+
+import numpy as np
+
+from .parser import PARSER_VERSION
+from .parser import Parser
+from .store import StatStore
+from .utils import get_logger
+
+log = get_logger()
+
+CACHE_SUFFIX = '.iostatc'
+
+_MAGIC = b'IOSTATC1'
+_HEADER_LENGTH = struct.Struct('<Q')
+_ALIGNMENT = 64
+# store attribute and dtype of each array
+_ARRAYS = [
+    ('dates', '<i8'),
+    ('cpu', '<f8'),
+    ('device_rows', '<i8'),
+    ('device_ids', '<i4'),
+    ('devices', '<f8'),
+]
+
+
+def make_cache_key(path):
+    st = os.stat(path)
+    source = '%s:%d:%d:%d' % (
+        os.path.abspath(path), st.st_size, st.st_mtime_ns, PARSER_VERSION)
+    return hashlib.sha1(source.encode()).hexdigest()
+
+
+def _align(offset):
+    return (offset + _ALIGNMENT - 1) // _ALIGNMENT * _ALIGNMENT
+
+
+def write_snapshot_file(path, store, extra_lines):
+    """
+    write the store as a JSON header followed by raw column arrays
+    """
+    arrays = {}
+    offset = 0
+    for name, dtype in _ARRAYS:
+        data = np.frombuffer(getattr(store, name), dtype=dtype)
+        arrays[name] = (data, offset)
+        offset = _align(offset + data.nbytes)
+
+    header = json.dumps({
+        'version': PARSER_VERSION,
+        'cpu_columns': store.cpu_columns,
+        'device_columns': store.device_columns,
+        'device_names': store.device_names,
+        'extra_lines': extra_lines,
+        'arrays': {
+            name: [dtype, arrays[name][1], len(arrays[name][0])]
+            for name, dtype in _ARRAYS
+        },
+    }).encode()
+    data_start = _align(len(_MAGIC) + _HEADER_LENGTH.size + len(header))
+
+    with open(path, 'wb') as f:
+        f.write(_MAGIC)
+        f.write(_HEADER_LENGTH.pack(len(header)))
+        f.write(header)
+        for data, offset in arrays.values():
+            f.seek(data_start + offset)
+            f.write(data.tobytes())
+
+
+def read_snapshot_file(path):
+    """
+    return (store, extra_lines), the arrays of the store are memory-mapped
+    """
+    with open(path, 'rb') as f:
+        if f.read(len(_MAGIC)) != _MAGIC:
+            raise ValueError('not a snapshot cache file: %s' % path)
+        length, = _HEADER_LENGTH.unpack(f.read(_HEADER_LENGTH.size))
+        header = json.loads(f.read(length).decode())
+    if header['version'] != PARSER_VERSION:
+        raise ValueError('unsupported snapshot version: %s' % path)
+
+    data_start = _align(len(_MAGIC) + _HEADER_LENGTH.size + length)
+    store = StatStore()
+    store.cpu_columns = header['cpu_columns']
+    store.device_columns = header['device_columns']
+    for name in header['device_names']:
+        store.get_device_id(name)
+    for name, (dtype, offset, count) in header['arrays'].items():
+        if count == 0:
+            data = np.empty(0, dtype=dtype)
+        else:
+            data = np.memmap(
+                path, dtype=dtype, mode='r',
+                offset=data_start + offset, shape=(count,),
+            )
+        setattr(store, name, data)
+    return store, header['extra_lines']
+
+
+class SnapshotCache:
+    """
+    Directory of parsed snapshots which evicts least recently used
+    entries when the total size exceeds max_size bytes
+    """
+
+    def __init__(self, cache_dir, max_size):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+
+    def get_path(self, key):
+        return os.path.join(self.cache_dir, key + CACHE_SUFFIX)
+
+    def get(self, key):
+        path = self.get_path(key)
+        if not os.path.isfile(path):
+            return None
+        try:
+            entry = read_snapshot_file(path)
+        except (OSError, ValueError, KeyError) as e:
+            log.warning('ignore broken cache %s: %s', path, e)
+            return None
+        os.utime(path)  # mark as recently used
+        return entry
+
+    def put(self, key, store, extra_lines):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        os.close(fd)
+        try:
+            write_snapshot_file(tmp_path, store, extra_lines)
+            os.replace(tmp_path, self.get_path(key))
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        self.evict()
+
+    def evict(self):
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(CACHE_SUFFIX):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            st = os.stat(path)
+            entries.append((st.st_mtime, st.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_size:
+                break
+            log.debug('evict cache: %s', path)
+            os.remove(path)
+            total -= size
+
+
+def load_cached(parser):
+    """
+    load all snapshots of the file from the cache, or parse and cache them,
+    then apply the filters of the parser
+    """
+    args = parser.args
+    if not os.path.isfile(args.data):
+        log.error('target file is not found: %s', args.data)
+        return
+
+    cache = SnapshotCache(args.cache_dir, args.cache_size * 1024 * 1024)
+    key = make_cache_key(args.data)
+    entry = cache.get(key)
+    if entry is None:
+        log.debug('cache miss: %s', args.data)
+        full_args = argparse.Namespace(**vars(args))
+        full_args.cache_dir = None
+        full_args.since = full_args.until = None
+        full_args.disks = []
+        full = Parser(full_args)
+        full.load()
+        cache.put(key, full.store, full.extra_lines)
+        entry = full.store, full.extra_lines
+
+    store, extra_lines = entry
+    store = store.select(args.since, args.until, args.disks)
+    if parser.store.projected:
+        parser.store.extend(store)
+    else:
+        parser.store = store
+    parser.extra_lines.extend(extra_lines)
@@ -0,0 +1,82 @@
+"""
+Write the store as columnar files with pyarrow
+
+The columns are passed to pyarrow from the buffers of the store without
+formatting each value, and the device names are dictionary-encoded.
+pyarrow is optional, install it to use the formats.
+"""
+import os
+
+import numpy as np
+
+from .consts import FORMAT_ARROW, FORMAT_PARQUET
+from .profiler import stage
+from .rolling import apply_rolling
+from .utils import add_suffix_to_name, get_logger
+
+log = get_logger()
+
+EXTENSIONS = {
+    FORMAT_ARROW: '.arrow',
+    FORMAT_PARQUET: '.parquet',
+}
+
+
+def get_columnar_path(path, suffix, format_):
+    """
+    >>> get_columnar_path('iostat.csv', 'cpu', 'parquet')
+    'iostat_cpu.parquet'
+    >>> get_columnar_path('/path/to/iostat', 'devices', 'arrow')
+    '/path/to/iostat_devices.arrow'
+    """
+    name, _ = os.path.splitext(add_suffix_to_name(path, suffix))
+    return name + EXTENSIONS[format_]
+
+
+def make_cpu_table(pa, store):
+    cpu = store.cpu_matrix()
+    # skip snapshots without cpu stat as well as csv
+    rows = np.flatnonzero(~np.isnan(cpu).all(axis=1))
+    arrays = [pa.array(store.timestamps()[rows], type=pa.timestamp('s'))]
+    arrays.extend(pa.array(cpu[rows, j]) for j in range(cpu.shape[1]))
+    return pa.table(arrays, names=['datetime'] + store.cpu_columns)
+
+
+def make_device_table(pa, store):
+    rows, ids, values = store.device_table()
+    dates = store.timestamps()[rows]
+    arrays = [
+        pa.array(dates, type=pa.timestamp('s')),
+        pa.DictionaryArray.from_arrays(
+            pa.array(ids), pa.array(store.device_names, type=pa.string())),
+    ]
+    arrays.extend(pa.array(values[:, j]) for j in range(values.shape[1]))
+    names = ['datetime', 'device'] + store.device_columns
+    return pa.table(arrays, names=names)
+
+
+def write_table(pa, table, path, format_):
+    if format_ == FORMAT_PARQUET:
+        import pyarrow.parquet as pq
+        pq.write_table(table, path)
+    else:
+        with pa.ipc.new_file(path, table.schema) as writer:
+            writer.write_table(table)
+    log.info('wrote %d rows: %s', table.num_rows, path)
+
+
+def write_columnar(args, parser):
+    try:
+        import pyarrow as pa
+    except ImportError:
+        log.error('install pyarrow to write %s files', args.format)
+        return
+
+    store = apply_rolling(args, parser.load())
+    with stage('write'):
+        if store.has_cpu:
+            path = get_columnar_path(args.output, 'cpu', args.format)
+            write_table(pa, make_cpu_table(pa, store), path, args.format)
+        if store.has_device:
+            path = get_columnar_path(args.output, 'devices', args.format)
+            write_table(pa, make_device_table(pa, store), path, args.format)
@@ -0,0 +1,180 @@
+"""
+Compare two iostat captures, e.g.) before and after tuning
+
+Both captures are parsed in parallel. The plot overlays them on the
+elapsed time since the first snapshot of each, and the summary shows
+percentile deltas of each disk in the subplot groups.
+"""
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from .consts import DEVICE_SUBPLOT_COLUMNS, SUMMARY_FORMAT_JSON
+from .files import parse_file
+from .profiler import PROFILER, stage
+from .rolling import apply_rolling
+from .summary import PERCENTILES, summarize_files
+from .utils import get_logger
+
+log = get_logger()
+
+# line styles of the captures in the plot
+LINESTYLES = ['-', '--']
+
+
+def get_labels(paths):
+    """
+    >>> get_labels(['before/iostat.log', 'after/iostat.log'])
+    ['before/iostat.log', 'after/iostat.log']
+    >>> get_labels(['/var/log/raid5.log', '/var/log/raid10.log'])
+    ['raid5.log', 'raid10.log']
+    """
+    labels = [os.path.basename(i) for i in paths]
+    if len(set(labels)) < len(labels):
+        return list(paths)
+    return labels
+
+
+def get_subplot_columns(subplots):
+    columns = []
+    for name in subplots:
+        columns.extend(i for i in DEVICE_SUBPLOT_COLUMNS[name]
+                       if i not in columns)
+    return columns
+
+
+def get_delta(before, after):
+    """
+    return (delta, change in percent) of the values, or None for missing
+
+    >>> get_delta(10.0, 15.0)
+    (5.0, 50.0)
+    >>> get_delta(0.0, 1.0)
+    (1.0, None)
+    """
+    if before is None or after is None:
+        return None, None
+    delta = after - before
+    if before == 0:
+        return delta, None
+    return delta, delta / before * 100
+
+
+def get_deltas(subplots, before, after):
+    """
+    return rows of (device, subplot, column, percentile, before, after,
+    delta, change) for the series in either of the summaries
+    """
+    before_series = before.series
+    after_series = after.series
+    disks = []
+    for name, _ in list(before_series) + list(after_series):
+        if name not in disks:
+            disks.append(name)
+
+    rows = []
+    for disk in disks:
+        for subplot in subplots:
+            for column in DEVICE_SUBPLOT_COLUMNS[subplot]:
+                key = (disk, column)
+                if key not in before_series and key not in after_series:
+                    continue
+                stats = [
+                    series[key].to_dict() if key in series else {}
+                    for series in (before_series, after_series)
+                ]
+                for q in PERCENTILES:
+                    name = 'p%d' % q
+                    values = [stat.get(name) for stat in stats]
+                    rows.append((disk, subplot, column, name)
+                                + tuple(values) + get_delta(*values))
+    return rows
+
+
+def format_table(labels, rows):
+    header = ['device', 'subplot', 'column', 'stat'] + labels
+    header.extend(['delta', 'change'])
+    lines = [header]
+    for row in rows:
+        line = list(row[:4])
+        line.extend('-' if i is None else '%.2f' % i for i in row[4:7])
+        line.append('-' if row[7] is None else '%+.1f%%' % row[7])
+        lines.append(line)
+
+    widths = [max(len(line[i]) for line in lines) for i in range(len(header))]
+    text = []
+    for line in lines:
+        fields = [field.ljust(width)
+                  for field, width in zip(line[:4], widths[:4])]
+        fields.extend(field.rjust(width)
+                      for field, width in zip(line[4:], widths[4:]))
+        text.append('  '.join(fields).rstrip())
+    return '\n'.join(text)
+
+
+def format_json(labels, rows):
+    devices = {}
+    for disk, subplot, column, name, *values in rows:
+        stat = dict(zip(labels + ['delta', 'change'], values))
+        columns = devices.setdefault(disk, {}).setdefault(subplot, {})
+        columns.setdefault(column, {})[name] = stat
+    return json.dumps({'captures': labels, 'devices': devices}, indent=2)
+
+
+def compare_summary(args):
+    columns = get_subplot_columns(args.subplots)
+    with stage('parse'), \
+            ProcessPoolExecutor(max_workers=len(args.captures)) as executor:
+        futures = [
+            executor.submit(summarize_files, args, [path], columns)
+            for path in args.captures
+        ]
+        before, after = [future.result() for future in futures]
+
+    rows = get_deltas(args.subplots, before, after)
+    if not rows:
+        log.error('no device stats to compare')
+        return
+    labels = get_labels(args.captures)
+    if args.format == SUMMARY_FORMAT_JSON:
+        print(format_json(labels, rows))
+    else:
+        print(format_table(labels, rows))
+
+
+def load_captures(args, keep_cpu, keep_device_columns):
+    """
+    parse the captures in parallel, and return their stores with
+    timestamps moved to the elapsed time from the first snapshot
+    """
+    with stage('parse'), \
+            ProcessPoolExecutor(max_workers=len(args.compare)) as executor:
+        futures = [
+            executor.submit(
+                parse_file, args, path, keep_cpu, keep_device_columns)
+            for path in args.compare
+        ]
+        results = [future.result() for future in futures]
+
+    stores = []
+    for path, (store, _) in zip(args.compare, results):
+        PROFILER.add_records(store)
+        if len(store) == 0:
+            log.warning('no snapshot to compare: %s', path)
+        else:
+            store = apply_rolling(args, store.sort())
+            store = store.shift(-int(store.timestamps()[0]))
+        stores.append(store)
+    return stores
+
+
+def plot_compare(args):
+    from .plotter import ComparePlotter, make_store
+    projection = make_store(args)
+    stores = load_captures(
+        args, projection.keep_cpu, projection.keep_device_columns)
+    labels = get_labels(args.compare)
+    with stage('plot'):
+        plotter = ComparePlotter(args, list(zip(labels, stores)))
+        plotter.plot()
+    plotter.render()
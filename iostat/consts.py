@@ -1,9 +1,16 @@
 PACKAGE_NAME = 'iostat-tool'
 
 # parser options
+SUB_COMMAND_COMPARE = 'compare'
 SUB_COMMAND_CSV = 'csv'
+SUB_COMMAND_DETECT = 'detect'
+SUB_COMMAND_INDEX = 'index'
 SUB_COMMAND_MONITOR = 'monitor'
 SUB_COMMAND_PLOT = 'plot'
+SUB_COMMAND_SUMMARY = 'summary'
+
+# index file next to the data file
+INDEX_SUFFIX = '.idx'
 
 # plot options
 PLOT_TYPE_PLOTTER = 'plotter'
@@ -13,6 +20,44 @@ PLOT_TYPES = [
     PLOT_TYPE_SCATTER,
 ]
 
+# csv options
+FORMAT_CSV = 'csv'
+FORMAT_PARQUET = 'parquet'
+FORMAT_ARROW = 'arrow'
+FORMATS = [
+    FORMAT_CSV,
+    FORMAT_PARQUET,
+    FORMAT_ARROW,
+]
+LAYOUT_LONG = 'long'
+LAYOUT_WIDE = 'wide'
+LAYOUTS = [
+    LAYOUT_LONG,
+    LAYOUT_WIDE,
+]
+
+# summary options
+SUMMARY_FORMAT_TABLE = 'table'
+SUMMARY_FORMAT_JSON = 'json'
+SUMMARY_FORMATS = [
+    SUMMARY_FORMAT_TABLE,
+    SUMMARY_FORMAT_JSON,
+]
+
+# rolling options
+ROLLING_MEAN = 'mean'
+ROLLING_MEDIAN = 'median'
+ROLLING_MAX = 'max'
+ROLLING_FUNCS = [
+    ROLLING_MEAN,
+    ROLLING_MEDIAN,
+    ROLLING_MAX,
+]
+
+# resample options
+RESAMPLE_AUTO = 'auto'
+RESAMPLE_OFF = 'off'
+
 # device subplots parameters
 IO_RQM = 'io_rqm'
 PERCENT_IO_RQM = '%io_rqm'
@@ -29,3 +74,20 @@ DEVICE_SUBPLOTS = [
     IOPS, IO_TRANSFER, PERCENT_UTIL,
     AVGRQ_SZ, AVGQU_SZ, AWAIT, SVCTM,
 ]
+
+# device columns for each subplot, a column not in iostat output is ignored
+DEVICE_SUBPLOT_COLUMNS = {
+    IO_RQM: ['rrqm/s', 'wrqm/s'],
+    PERCENT_IO_RQM: ['%rrqm', '%wrqm'],
+    IOPS: ['r/s', 'w/s'],
+    IO_TRANSFER: [
+        'rMB/s', 'wMB/s',    # iostat -m
+        'rkB/s', 'wkB/s',    # iostat -k
+        'rsec/s', 'wsec/s',  # by default
+    ],
+    PERCENT_UTIL: ['%util'],
+    AVGRQ_SZ: ['avgrq-sz', 'areq-sz', 'rareq-sz', 'wareq-sz'],
+    AVGQU_SZ: ['avgqu-sz', 'aqu-sz'],
+    AWAIT: ['await', 'r_await', 'w_await'],
+    SVCTM: ['await', 'svctm'],
+}
@@ -1,8 +1,37 @@
 import csv
 from contextlib import ContextDecorator
 
+import numpy as np
+
+from .consts import LAYOUT_WIDE
+from .profiler import stage
+from .rolling import apply_rolling
 from .utils import add_suffix_to_name
 
+# number of rows formatted and written at once
+BLOCK_ROWS = 65536
+
+
+def format_datetimes(timestamps):
+    """
+    format timestamps like str(datetime)
+
+    >>> format_datetimes(np.array([1528899050])).tolist()
+    ['2018-06-13 14:10:50']
+    """
+    dates = np.datetime_as_string(timestamps.astype('datetime64[s]'))
+    return np.char.replace(dates, 'T', ' ')
+
+
+def format_values(values):
+    """
+    format each column of values like str(float)
+
+    >>> format_values(np.array([[0.47, 1e+16], [np.nan, 0.0]]))
+    [['0.47', 'nan'], ['1e+16', '0.0']]
+    """
+    return [column.astype(str).tolist() for column in values.T]
+
 
 class BaseWriter(ContextDecorator):
 
@@ -14,6 +43,8 @@ class BaseWriter(ContextDecorator):
             self.f, dialect=args.dialect, delimiter=args.separator,
             quoting=csv.QUOTE_MINIMAL
         )
+        self.delimiter = self.writer.dialect.delimiter
+        self.lineterminator = self.writer.dialect.lineterminator
 
     def __enter__(self):
         return self
@@ -24,6 +55,24 @@ class BaseWriter(ContextDecorator):
     def write(self, row):
         self.writer.writerow(row)
 
+    def quote(self, field):
+        """
+        return the field quoted by the writer if it's needed
+        """
+        if (self.delimiter in field or '"' in field
+                or '\n' in field or '\r' in field):
+            return '"%s"' % field.replace('"', '""')
+        return field
+
+    def write_block(self, columns):
+        """
+        write rows of the columns at once, each column is a list of
+        formatted fields
+        """
+        lines = map(self.delimiter.join, zip(*columns))
+        self.f.write(self.lineterminator.join(lines))
+        self.f.write(self.lineterminator)
+
 
 class CPUWriter(BaseWriter):
 
@@ -31,6 +80,19 @@ class CPUWriter(BaseWriter):
         suffix = 'cpu'
         super().__init__(args, suffix)
 
+    def write_header(self, store):
+        self.write(['datetime'] + store.cpu_columns)
+
+    def write_rows(self, store):
+        cpu = store.cpu_matrix()
+        # skip snapshots without cpu stat
+        rows = np.flatnonzero(~np.isnan(cpu).all(axis=1))
+        timestamps = store.timestamps()
+        for start in range(0, len(rows), BLOCK_ROWS):
+            block = rows[start:start + BLOCK_ROWS]
+            dates = format_datetimes(timestamps[block]).tolist()
+            self.write_block([dates] + format_values(cpu[block]))
+
 
 class DeviceWriter(BaseWriter):
 
@@ -38,29 +100,71 @@ class DeviceWriter(BaseWriter):
         suffix = 'devices'
         super().__init__(args, suffix)
 
-    def write_rows(self, date, stats):
-        for disk_stat in stats:
-            for name, stat in disk_stat.items():
-                row = [date, name]
-                row.extend(stat)
-                self.writer.writerow(row)
+    def write_header(self, store):
+        self.write(['datetime', 'device'] + store.device_columns)
+
+    def write_rows(self, store):
+        rows, ids, values = store.device_table()
+        dates = format_datetimes(store.timestamps())
+        names = np.array([self.quote(i) for i in store.device_names])
+        for start in range(0, len(rows), BLOCK_ROWS):
+            end = start + BLOCK_ROWS
+            self.write_block(
+                [dates[rows[start:end]].tolist(),
+                 names[ids[start:end]].tolist()]
+                + format_values(values[start:end])
+            )
+
+
+class WideDeviceWriter(DeviceWriter):
+    """
+    Write a row for each snapshot with <disk>_<column> columns
+
+    The columns are made from all disks in the store, so a disk which
+    appears or disappears in the middle has empty fields in the other rows.
+    """
+
+    def write_header(self, store):
+        self.write(['datetime'] + [
+            '%s_%s' % (name, column)
+            for name in store.device_names
+            for column in store.device_columns
+        ])
+
+    def write_rows(self, store):
+        rows, ids, values = store.device_table()
+        snapshots = np.unique(rows)
+        dates = format_datetimes(store.timestamps()[snapshots]).tolist()
+        shape = (len(store.device_names), len(store.device_columns))
+        for start in range(0, len(snapshots), BLOCK_ROWS):
+            block = snapshots[start:start + BLOCK_ROWS]
+            first, last = np.searchsorted(rows, [block[0], block[-1] + 1])
+            fields = values[first:last].astype(str)
+            table = np.full((len(block),) + shape, '', dtype=object)
+            positions = np.searchsorted(block, rows[first:last])
+            table[positions, ids[first:last]] = fields
+            table = table.reshape(len(block), -1)
+            self.write_block(
+                [dates[start:start + BLOCK_ROWS]] + table.T.tolist())
+
+
+def get_device_writer(args):
+    if args.layout == LAYOUT_WIDE:
+        return WideDeviceWriter(args)
+    return DeviceWriter(args)
 
 
 def write_csv(args, parser):
-    def make_row(date, stat):
-        row = [date]
-        row.extend(stat)
-        return row
-
-    g = parser.parse()
-    first_row = next(g)
-    with CPUWriter(args) as cpu, DeviceWriter(args) as device:
-        # write first row after csv header
-        cpu.write(make_row('datetime', first_row['cpu']['columns']))
-        cpu.write(make_row(first_row['date'], first_row['cpu']['stat']))
-        device.write(['datetime', 'device'] + first_row['device']['columns'])
-        device.write_rows(first_row['date'], first_row['device']['stats'])
-        # sencod rows
-        for stat in g:
-            cpu.write(make_row(stat['date'], stat['cpu']['stat']))
-            device.write_rows(stat['date'], stat['device']['stats'])
+    store = apply_rolling(args, parser.load())
+    with stage('write'):
+        write_store_csv(args, store)
+
+
+def write_store_csv(args, store):
+    with CPUWriter(args) as cpu, get_device_writer(args) as device:
+        if store.has_cpu:
+            cpu.write_header(store)
+            cpu.write_rows(store)
+        if store.has_device:
+            device.write_header(store)
+            device.write_rows(store)
@@ -0,0 +1,335 @@
+"""
+Detect saturation episodes of disks while parsing iostat output
+
+Each disk has a tracker for each rule, which takes one value per snapshot
+and keeps its baseline in O(1), so the output is never buffered.
+
+* util: %util is at or above the threshold
+* queue: the queue size grows to a factor of its rolling mean
+* await: await is far above its EWMA baseline in standard deviations
+
+A run of saturated snapshots is an episode, it's reported when it lasts
+for the minimum duration.
+"""
+import math
+from collections import deque
+
+from .consts import AVGQU_SZ, AWAIT, DEVICE_SUBPLOT_COLUMNS, PERCENT_UTIL
+from .files import get_file_args, sort_data_paths
+from .parser import Parser
+from .profiler import stage
+from .store import StatStore, from_timestamp, to_timestamp
+from .utils import get_logger
+
+log = get_logger()
+
+# number of snapshots parsed before they are checked
+BATCH_ROWS = 4096
+
+# a queue size or await less than these is never saturated
+QUEUE_MIN = 1.0
+AWAIT_MIN = 10.0
+# floor of the await deviation not to flag small changes of a flat series
+AWAIT_MIN_STDDEV = 1.0
+
+EPISODE_START = 'start'
+EPISODE_END = 'end'
+
+
+class ThresholdTracker:
+    """
+    >>> tracker = ThresholdTracker(90.0)
+    >>> [tracker.update(t, v) for t, v in enumerate([50.0, 95.0, 90.0])]
+    [False, True, True]
+    """
+
+    def __init__(self, threshold):
+        self.threshold = threshold
+
+    def update(self, timestamp, value):
+        return value >= self.threshold
+
+
+class GrowthTracker:
+    """
+    Compare the value with the mean of the values in the rolling window
+
+    >>> tracker = GrowthTracker(2.0, 3)
+    >>> values = [1.0, 1.0, 1.0, 1.0, 2.5, 1.0]
+    >>> [tracker.update(t, v) for t, v in enumerate(values)]
+    [False, False, False, False, True, False]
+    """
+
+    def __init__(self, factor, window):
+        self.factor = factor
+        self.window = window
+        self.values = deque()
+        self.total = 0.0
+
+    def update(self, timestamp, value):
+        while self.values and self.values[0][0] <= timestamp - self.window:
+            self.total -= self.values.popleft()[1]
+        saturated = False
+        # wait until the window is filled to have the baseline
+        if self.values and timestamp - self.values[0][0] >= self.window - 1:
+            mean = self.total / len(self.values)
+            saturated = value >= QUEUE_MIN and value >= mean * self.factor
+        self.values.append((timestamp, value))
+        self.total += value
+        return saturated
+
+
+class ZScoreTracker:
+    """
+    Compare the value with the exponentially weighted mean and variance,
+    saturated values are not added to the baseline
+
+    >>> tracker = ZScoreTracker(3.0, 10)
+    >>> values = [20.0, 22.0] * 10 + [80.0, 21.0]
+    >>> [tracker.update(t, v) for t, v in enumerate(values)][-3:]
+    [False, True, False]
+    """
+
+    def __init__(self, zscore, window):
+        self.zscore = zscore
+        self.window = window
+        self.mean = None
+        self.variance = 0.0
+        self.started_at = None
+        self.last = None
+
+    def update(self, timestamp, value):
+        if self.mean is None:
+            self.mean = value
+            self.started_at = self.last = timestamp
+            return False
+
+        saturated = False
+        if timestamp - self.started_at >= self.window:
+            stddev = max(math.sqrt(self.variance), AWAIT_MIN_STDDEV)
+            z = (value - self.mean) / stddev
+            saturated = value >= AWAIT_MIN and z >= self.zscore
+        if not saturated:
+            # weight of the value by the time from the last one
+            alpha = 1 - math.exp(-(timestamp - self.last) / self.window)
+            diff = value - self.mean
+            increment = alpha * diff
+            self.mean += increment
+            self.variance = (1 - alpha) * (self.variance + diff * increment)
+            self.last = timestamp
+        return saturated
+
+
+class Rule:
+    """
+    columns are groups of the columns in order of preference, each column
+    of the first group found in the output is checked
+
+    >>> rule = Rule('await', [['await'], ['r_await', 'w_await']], None)
+    >>> rule.find_columns(['r/s', 'await', 'r_await', 'w_await'])
+    [1]
+    >>> rule.find_columns(['r/s', 'r_await', 'w_await'])
+    [1, 2]
+    >>> rule.find_columns(['r/s'])
+    []
+    """
+
+    def __init__(self, name, columns, make_tracker):
+        self.name = name
+        self.columns = columns
+        self.make_tracker = make_tracker
+
+    def find_columns(self, columns):
+        """
+        return indexes of the columns of the rule in the columns
+        """
+        for group in self.columns:
+            indexes = [columns.index(i) for i in group if i in columns]
+            if indexes:
+                return indexes
+        return []
+
+
+def get_rules(args):
+    awaits = DEVICE_SUBPLOT_COLUMNS[AWAIT]
+    return [
+        Rule('util', [[i] for i in DEVICE_SUBPLOT_COLUMNS[PERCENT_UTIL]],
+             lambda: ThresholdTracker(args.util_threshold)),
+        Rule('queue', [[i] for i in DEVICE_SUBPLOT_COLUMNS[AVGQU_SZ]],
+             lambda: GrowthTracker(args.queue_growth, args.baseline)),
+        # await of the older sysstat, or r_await and w_await of 11.7 and later
+        Rule('await', [awaits[:1], awaits[1:]],
+             lambda: ZScoreTracker(args.await_zscore, args.baseline)),
+    ]
+
+
+def get_detect_columns():
+    columns = []
+    for name in [PERCENT_UTIL, AVGQU_SZ, AWAIT]:
+        columns.extend(DEVICE_SUBPLOT_COLUMNS[name])
+    return columns
+
+
+class Episode:
+
+    def __init__(self, disk, rule, column, timestamp, value):
+        self.disk = disk
+        self.rule = rule
+        self.column = column
+        self.start = timestamp
+        self.end = timestamp
+        self.peak = value
+        self.samples = 1
+        self.reported = False
+
+    @property
+    def duration(self):
+        return self.end - self.start
+
+    def add(self, timestamp, value):
+        self.end = timestamp
+        self.peak = max(self.peak, value)
+        self.samples += 1
+
+    def format(self):
+        return '%s - %s %s %s: %s peak %.2f in %d snapshots' % (
+            from_timestamp(self.start), from_timestamp(self.end),
+            self.disk, self.rule, self.column, self.peak, self.samples)
+
+
+class Detector:
+    """
+    Trackers and open episodes of each disk and rule
+
+    >>> import argparse
+    >>> args = argparse.Namespace(
+    ...     util_threshold=90.0, queue_growth=2.0, await_zscore=3.0,
+    ...     baseline=60, min_duration=2)
+    >>> detector = Detector(args)
+    >>> detector.set_columns(['%util'])
+    >>> events = []
+    >>> for t, util in enumerate([10.0, 95.0, 99.0, 97.0, 10.0]):
+    ...     events.extend(detector.add(t, 'sda', [util]))
+    >>> [(event, episode.start, episode.end) for event, episode in events]
+    [('start', 1, 3), ('end', 1, 3)]
+
+    r_await and w_await are checked when the output has no await
+
+    >>> detector = Detector(args)
+    >>> detector.set_columns(['r_await', 'w_await'])
+    >>> events = []
+    >>> for t in range(80):
+    ...     values = [200.0, 5.0] if 70 <= t < 73 else [5.0, 5.0]
+    ...     events.extend(detector.add(t, 'sda', values))
+    >>> events.extend(detector.flush())
+    >>> [(event, episode.column) for event, episode in events]
+    [('start', 'r_await'), ('end', 'r_await')]
+    """
+
+    def __init__(self, args):
+        self.rules = get_rules(args)
+        self.min_duration = args.min_duration
+        self.columns = None
+        self.indexes = []
+        self.trackers = {}
+        self.episodes = {}
+
+    def set_columns(self, columns):
+        if columns == self.columns:
+            return
+        self.columns = columns
+        self.indexes = []
+        for rule in self.rules:
+            indexes = rule.find_columns(columns)
+            if not indexes:
+                log.warning('no column for %s rule in iostat output, '
+                            'it is not checked', rule.name)
+            self.indexes.extend((rule, index) for index in indexes)
+
+    def add(self, timestamp, disk, values):
+        """
+        check values of a disk in a snapshot, and return (event, episode)
+        when an episode lasts for the minimum duration or ends
+        """
+        events = []
+        for rule, index in self.indexes:
+            key = (disk, rule.name, index)
+            tracker = self.trackers.get(key)
+            if tracker is None:
+                tracker = rule.make_tracker()
+                self.trackers[key] = tracker
+
+            value = values[index]
+            episode = self.episodes.get(key)
+            if tracker.update(timestamp, value):
+                if episode is None:
+                    episode = Episode(
+                        disk, rule.name, self.columns[index], timestamp, value)
+                    self.episodes[key] = episode
+                else:
+                    episode.add(timestamp, value)
+                if (not episode.reported
+                        and episode.duration >= self.min_duration):
+                    episode.reported = True
+                    events.append((EPISODE_START, episode))
+            elif episode is not None:
+                del self.episodes[key]
+                if episode.reported:
+                    events.append((EPISODE_END, episode))
+        return events
+
+    def add_stat(self, stat):
+        device = stat['device']
+        if device['columns'] is None:
+            return []
+        self.set_columns(device['columns'])
+        timestamp = to_timestamp(stat['date'])
+        events = []
+        for disk in device['stats']:
+            for name, values in disk.items():
+                events.extend(self.add(timestamp, name, values))
+        return events
+
+    def add_store(self, store):
+        if not store.has_device:
+            return []
+        self.set_columns(store.device_columns)
+        rows, ids, values = store.device_table()
+        timestamps = store.timestamps()[rows].tolist()
+        names = [store.device_names[i] for i in ids.tolist()]
+        events = []
+        for timestamp, name, row in zip(timestamps, names, values.tolist()):
+            events.extend(self.add(timestamp, name, row))
+        return events
+
+    def flush(self):
+        """
+        end all open episodes at the end of the output
+        """
+        events = [(EPISODE_END, episode)
+                  for episode in self.episodes.values() if episode.reported]
+        self.episodes = {}
+        return events
+
+
+def make_store():
+    return StatStore(keep_cpu=False, keep_device_columns=get_detect_columns())
+
+
+def detect(args):
+    detector = Detector(args)
+    episodes = 0
+    for path in sort_data_paths(args):
+        parser = Parser(get_file_args(args, path), make_store())
+        with stage('parse'):
+            for store in parser.parse_batches(BATCH_ROWS):
+                with stage('detect'):
+                    events = detector.add_store(store)
+                for event, episode in events:
+                    if event == EPISODE_END:
+                        print(episode.format(), flush=True)
+                        episodes += 1
+    for _, episode in detector.flush():
+        print(episode.format(), flush=True)
+        episodes += 1
+    log.info('detected %d episodes', episodes)
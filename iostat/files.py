@@ -0,0 +1,171 @@
+import argparse
+import glob
+import gzip
+from concurrent.futures import ProcessPoolExecutor
+
+from .consts import INDEX_SUFFIX
+from .store import StatStore
+from .utils import get_logger
+
+log = get_logger()
+
+GZIP_MAGIC = b'\x1f\x8b'
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+
+COMPRESSION_GZIP = 'gzip'
+COMPRESSION_ZSTD = 'zstd'
+
+# bytes read from the head of the file to detect its line endings
+LINE_ENDING_PROBE_SIZE = 1 << 16
+
+
+def expand_data_paths(patterns):
+    """
+    return paths matched with each glob pattern in order, a pattern which
+    matches nothing is kept as it is to report the missing file.
+    Index files made by this tool are not matched.
+
+    >>> expand_data_paths(['tests/fixtures/sample_iostat_s*.output'])
+    ['tests/fixtures/sample_iostat_sector.output', \
+'tests/fixtures/sample_iostat_small.output']
+    >>> expand_data_paths(['path/to/missing.log'])
+    ['path/to/missing.log']
+    """
+    paths = []
+    for pattern in patterns:
+        matched = sorted(i for i in glob.glob(pattern)
+                         if not i.endswith(INDEX_SUFFIX))
+        if not matched:
+            matched = [pattern]
+        paths.extend(i for i in matched if i not in paths)
+    return paths
+
+
+def get_compression(path):
+    """
+    detect compression of the file by its magic number
+
+    >>> get_compression('tests/fixtures/sample_iostat.output') is None
+    True
+    """
+    with open(path, 'rb') as f:
+        magic = f.read(4)
+    if magic.startswith(GZIP_MAGIC):
+        return COMPRESSION_GZIP
+    elif magic.startswith(ZSTD_MAGIC):
+        return COMPRESSION_ZSTD
+    return None
+
+
+def has_carriage_return(path):
+    """
+    return True when the file has CRLF line endings, the byte offsets of
+    records are found only on LF, so such a file is parsed as text
+
+    >>> has_carriage_return('tests/fixtures/sample_iostat.output')
+    False
+    """
+    with open(path, 'rb') as f:
+        return b'\r' in f.read(LINE_ENDING_PROBE_SIZE)
+
+
+def open_data(path, compression=None):
+    """
+    open the file in binary mode, compressed data is decompressed
+    while reading it
+    """
+    if compression == COMPRESSION_GZIP:
+        return gzip.open(path, 'rb')
+    elif compression == COMPRESSION_ZSTD:
+        try:
+            import zstandard
+        except ImportError:
+            msg = 'install zstandard to read zstd compressed file: %s' % path
+            raise RuntimeError(msg)
+        f = open(path, 'rb')
+        return zstandard.ZstdDecompressor().stream_reader(
+            f, closefd=True, read_across_frames=True)
+    return open(path, 'rb')
+
+
+def get_file_args(args, path):
+    """
+    return a copy of args to parse one of the files
+    """
+    file_args = argparse.Namespace(**vars(args))
+    file_args.data = path
+    file_args.data_files = [path]
+    file_args.jobs = 1
+    return file_args
+
+
+def get_first_timestamp(args, path):
+    """
+    return timestamp of the first snapshot in the file, or None
+
+    >>> import argparse
+    >>> args = argparse.Namespace(
+    ...     since=None, until=None, disks=[], mmap=False, use_index=False)
+    >>> get_first_timestamp(args, 'tests/fixtures/sample_iostat.output')
+    1528899050
+    """
+    from .parser import Parser
+    file_args = get_file_args(args, path)
+    file_args.since = file_args.until = None
+    parser = Parser(file_args, StatStore(keep_cpu=False))
+    rows = parser.parse_all()
+    try:
+        for _ in rows:
+            return parser.store.dates[0]
+    finally:
+        rows.close()
+    return None
+
+
+def sort_data_paths(args):
+    """
+    return paths of the data files in order of their first snapshot,
+    e.g.) to read rotated files as a stream
+    """
+    timestamps = {path: get_first_timestamp(args, path)
+                  for path in args.data_files}
+    return sorted(args.data_files,
+                  key=lambda path: (timestamps[path] is not None,
+                                    timestamps[path] or 0))
+
+
+def parse_file(args, path, keep_cpu, keep_device_columns):
+    from .parser import Parser
+    store = StatStore(
+        keep_cpu=keep_cpu, keep_device_columns=keep_device_columns)
+    parser = Parser(get_file_args(args, path), store)
+    store = parser.load()
+    return store, parser.extra_lines
+
+
+def load_files(parser, jobs):
+    """
+    parse each file and merge the snapshots into parser.store in order of
+    timestamps, the files are parsed in a process pool when jobs > 1
+    """
+    args = parser.args
+    params = (parser.store.keep_cpu, parser.store.keep_device_columns)
+    if jobs > 1:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            futures = [
+                executor.submit(parse_file, args, path, *params)
+                for path in args.data_files
+            ]
+            results = [future.result() for future in futures]
+    else:
+        results = [parse_file(args, path, *params)
+                   for path in args.data_files]
+
+    # rotated files don't overlap each other in most cases,
+    # so merge them in order of the first timestamp before sorting
+    results = [(store, lines) for store, lines in results if len(store) > 0]
+    results.sort(key=lambda result: result[0].dates[0])
+    for store, extra_lines in results:
+        parser.store.extend(store)
+        parser.extra_lines.extend(extra_lines)
+    parser.store = parser.store.sort()
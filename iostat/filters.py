@@ -1,30 +1,42 @@
 from functools import partial
 
 
-def filter_since(since_date, stat):
-    return since_date <= stat['date']
+def filter_since(since_date, date):
+    return since_date <= date
 
 
-def filter_until(until_date, stat):
-    return stat['date'] <= until_date
+def filter_until(until_date, date):
+    return date <= until_date
 
 
-def filter_disks(disk_names, stat):
-    filtered = []
-    for disk in stat['device']['stats']:
-        for name in disk:
-            if name in disk_names:
-                filtered.append(disk)
-    stat['device']['stats'] = filtered
-    return True
+def filter_after_until(until_date, date):
+    # dates in iostat output only move forward,
+    # so nothing after until_date has to be read
+    return until_date < date
 
 
-def get_filters(args):
+def filter_disks(disk_names, name):
+    return name in disk_names
+
+
+def get_date_filters(args):
     filters = []
     if args.since is not None:
         filters.append(partial(filter_since, args.since))
     if args.until is not None:
         filters.append(partial(filter_until, args.until))
+    return filters
+
+
+def get_disk_filters(args):
+    filters = []
     if args.disks:
         filters.append(partial(filter_disks, args.disks))
     return filters
+
+
+def get_stop_filters(args):
+    filters = []
+    if args.until is not None:
+        filters.append(partial(filter_after_until, args.until))
+    return filters
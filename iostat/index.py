@@ -0,0 +1,173 @@
+import mmap
+import os
+import struct
+from array import array
+
+import numpy as np
+
+from .consts import INDEX_SUFFIX
+from .files import get_compression, has_carriage_return
+from .store import to_timestamp
+from .tokenizer import DATE
+from .tokenizer import Tokenizer
+from .utils import get_logger
+
+log = get_logger()
+
+INDEX_VERSION = 1
+
+_MAGIC = b'IOSTATIX'
+# magic, version, source size, source mtime in ns, number of records
+_HEADER = struct.Struct('<8sIqqq')
+
+
+def get_index_path(path):
+    """
+    >>> get_index_path('/path/to/iostat.log')
+    '/path/to/iostat.log.idx'
+    """
+    return path + INDEX_SUFFIX
+
+
+def get_fingerprint(path):
+    st = os.stat(path)
+    return st.st_size, st.st_mtime_ns
+
+
+def iter_records(m, tokenizer, start=0):
+    """
+    yield (offset, date) of timestamp lines which start a record,
+    start must be at the beginning of a block
+    """
+    pos = start
+    size = len(m)
+    while True:
+        while m[pos:pos + 1] == b'\n':
+            pos += 1
+        if pos >= size:
+            break
+        end = m.find(b'\n', pos)
+        if end == -1:
+            end = size
+        if m[pos:pos + 1].isdigit():
+            token, date = tokenizer.tokenize(m[pos:end].decode())
+            if token == DATE:
+                yield pos, date
+        # a record starts after a blank line
+        block_end = m.find(b'\n\n', end)
+        if block_end == -1:
+            break
+        pos = block_end + 2
+
+
+class TimestampIndex:
+    """
+    Byte offsets of each record in iostat output keyed by its timestamp
+    """
+
+    def __init__(self, timestamps, offsets, size, mtime_ns):
+        self.timestamps = timestamps
+        self.offsets = offsets
+        self.size = size
+        self.mtime_ns = mtime_ns
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    @classmethod
+    def build(cls, path):
+        timestamps, offsets = array('q'), array('q')
+        size, mtime_ns = get_fingerprint(path)
+        if size > 0:
+            with open(path, 'rb') as f:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                    for offset, date in iter_records(m, Tokenizer()):
+                        timestamps.append(to_timestamp(date))
+                        offsets.append(offset)
+        return cls(timestamps, offsets, size, mtime_ns)
+
+    @classmethod
+    def load(cls, index_path, path):
+        """
+        return None when the index is broken or stale for the path
+        """
+        try:
+            with open(index_path, 'rb') as f:
+                header = f.read(_HEADER.size)
+                magic, version, size, mtime_ns, count = _HEADER.unpack(header)
+                if magic != _MAGIC or version != INDEX_VERSION:
+                    return None
+                if (size, mtime_ns) != get_fingerprint(path):
+                    return None
+                timestamps, offsets = array('q'), array('q')
+                timestamps.fromfile(f, count)
+                offsets.fromfile(f, count)
+        except (OSError, EOFError, struct.error):
+            return None
+        return cls(timestamps, offsets, size, mtime_ns)
+
+    def save(self, index_path):
+        with open(index_path, 'wb') as f:
+            f.write(_HEADER.pack(
+                _MAGIC, INDEX_VERSION,
+                self.size, self.mtime_ns, len(self.timestamps),
+            ))
+            self.timestamps.tofile(f)
+            self.offsets.tofile(f)
+
+    def find_range(self, since=None, until=None):
+        """
+        return byte range of records between since and until,
+        the end is None when the range lasts until the end of file
+        """
+        timestamps = np.frombuffer(self.timestamps, dtype=np.int64)
+        start, end = 0, None
+        if since is not None:
+            i = np.searchsorted(timestamps, to_timestamp(since), 'left')
+            if i < len(self.offsets):
+                start = self.offsets[i]
+            else:
+                start = self.size
+        if until is not None:
+            i = np.searchsorted(timestamps, to_timestamp(until), 'right')
+            if i < len(self.offsets):
+                end = self.offsets[i]
+        return start, end
+
+
+def build_index(path):
+    index = TimestampIndex.build(path)
+    index_path = get_index_path(path)
+    try:
+        index.save(index_path)
+    except OSError as e:
+        log.warning('failed to save index: %s', e)
+    else:
+        log.info('saved index of %d records: %s', len(index), index_path)
+    return index
+
+
+def index_files(paths):
+    """
+    build the index of each file, compressed files and files with CRLF
+    line endings are skipped since they can't be seeked by the index
+    """
+    for path in paths:
+        compression = get_compression(path)
+        if compression is not None:
+            log.warning('skip indexing %s compressed file: %s',
+                        compression, path)
+        elif has_carriage_return(path):
+            log.warning('skip indexing file with CRLF line endings: %s', path)
+        else:
+            build_index(path)
+
+
+def get_index(path):
+    """
+    load the index next to the path, or build it when missing or stale
+    """
+    index = TimestampIndex.load(get_index_path(path), path)
+    if index is None:
+        index = build_index(path)
+    return index
@@ -1,14 +1,26 @@
 import argparse
 import csv
 import logging
+import shlex
 
 from .consts import DEVICE_SUBPLOTS
+from .consts import FORMATS, FORMAT_CSV, LAYOUTS, LAYOUT_LONG
 from .consts import PLOT_TYPES, PLOT_TYPE_PLOTTER, PLOT_TYPE_SCATTER
-from .consts import SUB_COMMAND_CSV, SUB_COMMAND_MONITOR, SUB_COMMAND_PLOT
+from .consts import RESAMPLE_AUTO, RESAMPLE_OFF
+from .consts import ROLLING_FUNCS, ROLLING_MEAN
+from .consts import SUB_COMMAND_COMPARE, SUB_COMMAND_CSV
+from .consts import SUB_COMMAND_DETECT, SUB_COMMAND_INDEX
+from .consts import SUB_COMMAND_MONITOR, SUB_COMMAND_PLOT
+from .consts import SUB_COMMAND_SUMMARY
+from .consts import SUMMARY_FORMATS, SUMMARY_FORMAT_TABLE
 from .csv import write_csv
+from .files import expand_data_paths
 from .parser import Parser
+from .profiler import PROFILER, stage
+from .rolling import apply_rolling
 from .utils import get_logger
 from .utils import parse_datetime
+from .utils import parse_duration
 
 __version__ = '0.3.1'
 _DATETIME_FORMAT_HELP = 'yyyymmddHHMISS'
@@ -35,6 +47,89 @@ def dt_type(s):
     return parse_datetime(s)
 
 
+def resample_type(s):
+    if s == RESAMPLE_AUTO:
+        return RESAMPLE_AUTO
+    elif s == RESAMPLE_OFF:
+        return None
+    try:
+        seconds = parse_duration(s)
+    except ValueError:
+        seconds = 0
+    if seconds <= 0:
+        msg = 'set "%s", "%s" or duration, e.g.) 10s, 5m, 1h' % (
+            RESAMPLE_AUTO, RESAMPLE_OFF)
+        raise argparse.ArgumentTypeError(msg)
+    return seconds
+
+
+def duration_type(s):
+    """
+    >>> duration_type('5m')
+    300
+    """
+    try:
+        seconds = parse_duration(s)
+    except ValueError:
+        seconds = -1
+    if seconds < 0:
+        msg = 'set duration, e.g.) 10s, 5m, 1h'
+        raise argparse.ArgumentTypeError(msg)
+    return seconds
+
+
+def rolling_type(s):
+    """
+    >>> rolling_type('60s')
+    60
+    """
+    seconds = duration_type(s)
+    if seconds <= 0:
+        raise argparse.ArgumentTypeError('set duration longer than 0s')
+    return seconds
+
+
+def window_type(s):
+    """
+    return (max number of snapshots, duration in seconds or None)
+
+    >>> window_type('600')
+    (600, None)
+    >>> window_type('10m')
+    (601, 600)
+    """
+    if s.isdigit() and int(s) > 0:
+        return int(s), None
+    try:
+        seconds = parse_duration(s)
+    except ValueError:
+        seconds = 0
+    if seconds <= 0:
+        msg = 'set number of snapshots or duration, e.g.) 3600, 10m, 1h'
+        raise argparse.ArgumentTypeError(msg)
+    # iostat reports at most one snapshot per second
+    return seconds + 1, seconds
+
+
+def source_type(s):
+    """
+    return (tag or None, command and args)
+
+    >>> source_type('node1=ssh node1 "iostat -xt 1"')
+    ('node1', ['ssh', 'node1', 'iostat -xt 1'])
+    >>> source_type('iostat -xt 1')
+    (None, ['iostat', '-xt', '1'])
+    """
+    tag = None
+    name, sep, command = s.partition('=')
+    if sep and name and ' ' not in name:
+        tag, s = name, command
+    command_and_args = shlex.split(s)
+    if not command_and_args:
+        raise argparse.ArgumentTypeError('set command, e.g.) "iostat -xt 1"')
+    return tag, command_and_args
+
+
 def sep_type(s):
     if s == _COMMA:
         return ','
@@ -44,12 +139,90 @@ def sep_type(s):
         raise argparse.ArgumentTypeError('separator is wrong')
 
 
+def parse_read_argument(subparser):
+    subparser.add_argument(
+        '--mmap', action='store_true',
+        help='parse iostat output file with memory-mapped bytes, '
+             'it is faster for huge files'
+    )
+    subparser.add_argument(
+        '--index', action='store_true', dest='use_index', default=False,
+        help='seek --since/--until with timestamp index file next to '
+             'iostat output file, it\'s built when missing or stale'
+    )
+
+
+def parse_parser_argument(subparser):
+    parse_read_argument(subparser)
+    subparser.add_argument(
+        '--jobs', action='store', type=int, default=1,
+        help='set number of processes to parse iostat output file '
+             'in chunks, default is 1'
+    )
+    subparser.add_argument(
+        '--cache-dir', action='store', dest='cache_dir',
+        help='set directory to cache parsed iostat output'
+    )
+    subparser.add_argument(
+        '--cache-size', action='store', dest='cache_size', type=int,
+        default=1024,
+        help='set max size of cache directory in MiB, default is 1024'
+    )
+
+
+def parse_rolling_argument(subparser):
+    subparser.add_argument(
+        '--rolling', action='store', type=rolling_type,
+        help='set duration, e.g.) 60s, 10m, of rolling window to smooth '
+             'each series'
+    )
+    subparser.add_argument(
+        '--rolling-func', action='store', dest='rolling_func',
+        choices=ROLLING_FUNCS, default=ROLLING_MEAN,
+        help='set function to aggregate values in the rolling window, '
+             'default is mean'
+    )
+
+
+def parse_compare_argument(subparsers):
+    compare_parser = subparsers.add_parser(SUB_COMMAND_COMPARE)
+    compare_parser.set_defaults(
+        subplots=DEVICE_SUBPLOTS,
+    )
+    parse_read_argument(compare_parser)
+    compare_parser.add_argument(
+        'captures', nargs=2, metavar='CAPTURE',
+        help='set paths to 2 iostat output files to compare'
+    )
+    compare_parser.add_argument(
+        '--subplots', action='store', nargs='+', choices=DEVICE_SUBPLOTS,
+        help='set subplots to compare'
+    )
+    compare_parser.add_argument(
+        '--format', action='store', choices=SUMMARY_FORMATS,
+        default=SUMMARY_FORMAT_TABLE,
+        help='set output format, default is table'
+    )
+
+
 def parse_csv_argument(subparsers):
     csv_parser = subparsers.add_parser(SUB_COMMAND_CSV)
     csv_parser.set_defaults(
         dialect='excel',
         separator=_COMMA,
     )
+    parse_parser_argument(csv_parser)
+    csv_parser.add_argument(
+        '--format', action='store', choices=FORMATS, default=FORMAT_CSV,
+        help='set output format, parquet and arrow need pyarrow, '
+             'default is csv'
+    )
+    parse_rolling_argument(csv_parser)
+    csv_parser.add_argument(
+        '--layout', action='store', choices=LAYOUTS, default=LAYOUT_LONG,
+        help='set layout of devices csv, long has a row for each device '
+             'and wide has a row for each snapshot, default is long'
+    )
     csv_parser.add_argument(
         '--dialect', action='store', choices=csv.list_dialects(),
         help='set dialect for csv writer, default is excel'
@@ -60,20 +233,105 @@ def parse_csv_argument(subparsers):
     )
 
 
+def parse_detector_argument(subparser):
+    subparser.add_argument(
+        '--util-threshold', action='store', dest='util_threshold',
+        type=float, default=90.0,
+        help='set %%util to detect saturation, default is 90.0'
+    )
+    subparser.add_argument(
+        '--queue-growth', action='store', dest='queue_growth',
+        type=float, default=2.0,
+        help='set factor of queue size to its mean in the baseline to '
+             'detect saturation, default is 2.0'
+    )
+    subparser.add_argument(
+        '--await-zscore', action='store', dest='await_zscore',
+        type=float, default=3.0,
+        help='set standard deviations of await above the baseline to '
+             'detect saturation, default is 3.0'
+    )
+    subparser.add_argument(
+        '--baseline', action='store', type=duration_type, default=300,
+        help='set duration, e.g.) 10m, of rolling baseline for queue size '
+             'and await, default is 5m'
+    )
+    subparser.add_argument(
+        '--min-duration', action='store', dest='min_duration',
+        type=duration_type, default=3,
+        help='set minimum duration of saturation to report, default is 3s'
+    )
+
+
+def parse_detect_argument(subparsers):
+    detect_parser = subparsers.add_parser(SUB_COMMAND_DETECT)
+    parse_read_argument(detect_parser)
+    parse_detector_argument(detect_parser)
+
+
+def parse_index_argument(subparsers):
+    subparsers.add_parser(SUB_COMMAND_INDEX)
+
+
 def parse_monitor_argument(subparsers):
     monitor_parser = subparsers.add_parser(SUB_COMMAND_MONITOR)
     monitor_parser.set_defaults(
         iostat_args='',
+        sources=None,
+        replays=None,
+        speed=1.0,
         max_queue_size=256,
+        redraw_interval=1.0,
+        window_output='iostat_window.csv',
+        dialect='excel',
+        separator=',',
+        layout=LAYOUT_LONG,
     )
     monitor_parser.add_argument(
         '--iostat-args', action='store', dest='iostat_args',
         help='set arguments for iostat'
     )
+    monitor_parser.add_argument(
+        '--source', action='append', dest='sources', type=source_type,
+        help='set command to run iostat with an optional tag, '
+             'e.g.) "node1=ssh node1 iostat -xt 1", repeat it to monitor '
+             'several hosts, --iostat-args is ignored if it\'s set'
+    )
+    monitor_parser.add_argument(
+        '--replay', action='append', dest='replays',
+        help='set path to iostat output file to replay instead of running '
+             'iostat, it can be repeated and used with --source'
+    )
+    monitor_parser.add_argument(
+        '--speed', action='store', type=float,
+        help='set speed factor to replay, 0 replays as fast as possible, '
+             'default is 1.0'
+    )
     monitor_parser.add_argument(
         '--max-queue-size', action='store', dest='max_queue_size', type=int,
         help='set queue size to read iostat output'
     )
+    monitor_parser.add_argument(
+        '--redraw-interval', action='store', dest='redraw_interval',
+        type=float,
+        help='set minimum interval in seconds to redraw the figure, '
+             'default is 1.0'
+    )
+    monitor_parser.add_argument(
+        '--window', action='store', type=window_type, default='1h',
+        help='set number of snapshots or duration, e.g.) 10m, 1h, '
+             'to keep for the figure, default is 1h'
+    )
+    monitor_parser.add_argument(
+        '--window-output', action='store', dest='window_output',
+        help='set path to export snapshots in the window as csv files '
+             'when SIGUSR1 is received, default is iostat_window.csv'
+    )
+    monitor_parser.add_argument(
+        '--detect', action='store_true',
+        help='log saturation of disks while monitoring'
+    )
+    parse_detector_argument(monitor_parser)
 
 
 def parse_plot_argument(subparsers):
@@ -83,7 +341,9 @@ def parse_plot_argument(subparsers):
         subplots=DEVICE_SUBPLOTS,
         vlines=[],
         x_datetime_format=None,
+        compare=None,
     )
+    parse_parser_argument(plot_parser)
 
     plot_parser.add_argument(
         '--plot-type', action='store', dest='plot_type', choices=PLOT_TYPES,
@@ -105,6 +365,20 @@ def parse_plot_argument(subparsers):
         '--title', action='store', dest='title', default='iostat output',
         help='set title for graph'
     )
+    plot_parser.add_argument(
+        '--resample', action='store', type=resample_type,
+        default=RESAMPLE_AUTO,
+        help='aggregate each series into time buckets of the duration, '
+             'e.g.) 10s, 5m, 1h, and draw mean with min/max envelope. '
+             '"%s" (by default) fits buckets to figure width, '
+             '"%s" disables it' % (RESAMPLE_AUTO, RESAMPLE_OFF)
+    )
+    parse_rolling_argument(plot_parser)
+    plot_parser.add_argument(
+        '--compare', action='store', nargs=2, metavar='CAPTURE',
+        help='set paths to 2 iostat output files to overlay them on '
+             'elapsed time instead of --data'
+    )
     group = plot_parser.add_mutually_exclusive_group()
     group.add_argument(
         '--without-cpu', dest='with_cpu', action='store_false',
@@ -116,13 +390,28 @@ def parse_plot_argument(subparsers):
     )
 
 
-def parse_argument():
+def parse_summary_argument(subparsers):
+    summary_parser = subparsers.add_parser(SUB_COMMAND_SUMMARY)
+    parse_read_argument(summary_parser)
+    summary_parser.add_argument(
+        '--format', action='store', choices=SUMMARY_FORMATS,
+        default=SUMMARY_FORMAT_TABLE,
+        help='set output format, default is table'
+    )
+
+
+def parse_argument(argv=None):
     parser = argparse.ArgumentParser()
     parser.set_defaults(
         backend='Agg',
         data=None,
         figoutput=None,
         figsize=None,
+        cache_dir=None,
+        cache_size=1024,
+        jobs=1,
+        mmap=False,
+        use_index=False,
         output='iostat.log',
         # filter options
         disks=[],
@@ -131,6 +420,8 @@ def parse_argument():
         since=None,
         until=None,
         subcommand=SUB_COMMAND_MONITOR,
+        profile=False,
+        profile_output=None,
     )
 
     parser.add_argument(
@@ -139,8 +430,10 @@ def parse_argument():
              'use TkAgg to monitor in the foreground',
     )
     parser.add_argument(
-        '--data', action='store',
-        help='set path to iostat output file',
+        '--data', action='append',
+        help='set path or glob pattern of iostat output files, repeat it '
+             'to read several files, gzip or zstd compressed files are '
+             'also available',
     )
     parser.add_argument(
         '--fig-output', action='store', dest='figoutput',
@@ -171,22 +464,41 @@ def parse_argument():
 
     subparsers = parser.add_subparsers(dest='subcommand')
     subparsers.required = True
+    parse_compare_argument(subparsers)
     parse_csv_argument(subparsers)
+    parse_detect_argument(subparsers)
+    parse_index_argument(subparsers)
     parse_monitor_argument(subparsers)
     parse_plot_argument(subparsers)
+    parse_summary_argument(subparsers)
 
     # for debug
     parser.add_argument(
         '-v', '--verbose', action='store_true',
         help='set verbose mode')
+    parser.add_argument(
+        '--profile', action='store_true',
+        help='print wall time of each stage, throughput and peak memory '
+             'usage at exit'
+    )
+    parser.add_argument(
+        '--profile-output', action='store', dest='profile_output',
+        help='set path to save cProfile stats, it implies --profile'
+    )
     parser.add_argument(
         '--version', action='version', version='%%(prog)s %s' % __version__,
         help='show program version',
     )
 
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
+    args.data_files = []
+    if args.data is not None:
+        args.data_files = expand_data_paths(args.data)
+        args.data = args.data_files[0]
     if args.verbose:
         log.setLevel(logging.DEBUG)
+    if args.profile_output is not None:
+        args.profile = True
 
     return args
 
@@ -195,32 +507,68 @@ def main():
     args = parse_argument()
     log.debug(args)
 
+    if args.profile:
+        PROFILER.enable(cprofile=args.profile_output is not None)
+    try:
+        run(args)
+    finally:
+        PROFILER.report(args.profile_output)
+
+
+def run(args):
     import matplotlib
     matplotlib.use(args.backend)
 
     if args.subcommand == SUB_COMMAND_MONITOR:
         from .process import run_iostat
         run_iostat(args)
+    elif args.subcommand == SUB_COMMAND_COMPARE:
+        from .compare import compare_summary
+        compare_summary(args)
+    elif args.subcommand == SUB_COMMAND_PLOT and args.compare is not None:
+        from .compare import plot_compare
+        plot_compare(args)
     else:
         if args.data is None:
             log.error('set target file with "--data path/to/file"')
             return
 
-        parser = Parser(args)
+        if args.subcommand == SUB_COMMAND_INDEX:
+            from .index import index_files
+            index_files(args.data_files)
+            return
+
         if args.subcommand == SUB_COMMAND_CSV:
-            write_csv(args, parser)
+            if args.format == FORMAT_CSV:
+                write_csv(args, Parser(args))
+            else:
+                from .columnar import write_columnar
+                write_columnar(args, Parser(args))
+        elif args.subcommand == SUB_COMMAND_DETECT:
+            from .detect import detect
+            detect(args)
+        elif args.subcommand == SUB_COMMAND_SUMMARY:
+            from .summary import summarize
+            summarize(args)
         elif args.subcommand == SUB_COMMAND_PLOT:
-            stats = [stat for stat in parser.parse()]
             if args.plot_type == PLOT_TYPE_PLOTTER:
-                from .plotter import Plotter
-                plotter = Plotter(args, stats)
-                plotter.plot()
+                from .plotter import Plotter, make_store
+                # keep only the series to plot while parsing
+                store = Parser(args, make_store(args)).load()
+                store = apply_rolling(args, store)
+                with stage('plot'):
+                    plotter = Plotter(args, store)
+                    plotter.plot()
                 plotter.render()
             elif args.plot_type == PLOT_TYPE_SCATTER:
+                from .ring import History
                 from .scatter import Scatter
-                scatter = Scatter(args)
-                for stat in stats:
-                    scatter.scatter(stat)
+                store = apply_rolling(args, Parser(args).load())
+                with stage('plot'):
+                    scatter = Scatter(
+                        args, {None: History(max(len(store), 1))})
+                    for stat in store.iter_stats():
+                        scatter.scatter(stat)
                 scatter.render()
 
 
@@ -0,0 +1,87 @@
+import mmap
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from .index import iter_records
+from .profiler import PROFILER
+from .store import StatStore
+from .tokenizer import Tokenizer
+from .utils import get_logger
+
+log = get_logger()
+
+
+def find_record_start(m, pos, tokenizer):
+    """
+    return offset of the first record after the blank line from pos
+    """
+    pos = m.find(b'\n\n', pos)
+    if pos == -1:
+        return len(m)
+    for offset, _ in iter_records(m, tokenizer, pos + 2):
+        return offset
+    return len(m)
+
+
+def find_chunk_offsets(path, jobs, start=0, end=None):
+    """
+    split the range of file into at most jobs chunks which start at a record
+    """
+    if end is None:
+        end = os.path.getsize(path)
+    size = end - start
+    if size <= 0:
+        return []
+
+    tokenizer = Tokenizer()
+    offsets = [start]
+    with open(path, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+            for i in range(1, jobs):
+                pos = max(start + size * i // jobs, offsets[-1])
+                offset = find_record_start(m, pos, tokenizer)
+                if offset >= end:
+                    break
+                if offset > offsets[-1]:
+                    offsets.append(offset)
+    offsets.append(end)
+    return list(zip(offsets, offsets[1:]))
+
+
+def parse_chunk(args, start, end, keep_cpu, keep_device_columns):
+    from .parser import Parser
+    store = StatStore(
+        keep_cpu=keep_cpu, keep_device_columns=keep_device_columns)
+    parser = Parser(args, store)
+    for _ in parser.parse_mmap(start, end):
+        pass
+    return parser.store, parser.extra_lines
+
+
+def load_parallel(parser, jobs):
+    """
+    parse chunks of the file in a process pool and merge the results
+    into parser.store and parser.extra_lines in order
+    """
+    path = parser.args.data
+    if not os.path.isfile(path):
+        log.error('target file is not found: %s', path)
+        return
+
+    start, end = parser.find_range()
+    if start > 0:
+        parser.parse_header()
+    chunks = find_chunk_offsets(path, jobs, start, end)
+    log.debug('parse %d chunks: %s', len(chunks), chunks)
+    # keep only the stats which the store keeps in the workers too
+    params = (parser.store.keep_cpu, parser.store.keep_device_columns)
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = [
+            executor.submit(parse_chunk, parser.args, start, end, *params)
+            for start, end in chunks
+        ]
+        for future in futures:
+            store, extra_lines = future.result()
+            parser.store.extend(store)
+            parser.extra_lines.extend(extra_lines)
+    PROFILER.add_bytes(sum(end - start for start, end in chunks))
@@ -1,12 +1,24 @@
+import io
+import mmap
 import os
 
-from .filters import get_filters
-from .utils import get_iostat_date_format
+import numpy as np
+
+from .filters import get_date_filters, get_disk_filters
+from .filters import get_stop_filters
+from .files import get_compression, has_carriage_return, load_files
+from .files import open_data
+from .profiler import PROFILER, stage
+from .store import StatStore
+from .tokenizer import CPU_HEADER, DATE, DEVICE_HEADER
+from .tokenizer import Tokenizer
 from .utils import get_logger
-from .utils import parse_datetime
 
 log = get_logger()
 
+# increase when the parsed result changes, it invalidates snapshot caches
+PARSER_VERSION = 1
+
 
 class Parser:
 
@@ -14,88 +26,351 @@ class Parser:
     DATE = 'DATE'
     DEVICE = 'Device'
 
-    def __init__(self, args):
+    def __init__(self, args, store=None):
         self.args = args
         self.extra_lines = []
         self.state = None
-        self.filters = get_filters(args)
-        self.init_stat()
-
-    def init_stat(self):
-        self.date = None
-        self.cpu_stat = {'columns': None, 'stat': None}
-        self.device_stat = {'columns': None, 'stats': []}
-
-    def make_stat(self):
-        stat = {
-            'date': self.date,
-            'cpu': self.cpu_stat,
-            'device': self.device_stat,
-        }
-        self.init_stat()
-        return stat
+        self.tokenizer = Tokenizer()
+        self.date_filters = get_date_filters(args)
+        self.disk_filters = get_disk_filters(args)
+        self.stop_filters = get_stop_filters(args)
+        if store is None:
+            store = StatStore()
+        self.store = store
+        self.row = None
+        self.cpu_width = None
+        self.device_width = None
+        self.names = {}
+        self.skipping = False
+        self.finished = False
+        # for follow mode
+        self.offset = 0
+        self.partial_line = b''
 
     def parse_cpu_stat(self, line):
-        self.cpu_stat['stat'] = [float(i) for i in line.split()]
+        if self.row is None or not self.store.has_cpu:
+            return
+        values = [float(i) for i in line.split()]
+        if len(values) != self.cpu_width:
+            log.debug('broken cpu line: %s', line)
+            return
+        self.store.add_cpu(values)
 
     def parse_device_stat(self, line):
+        if self.row is None or not self.store.has_device:
+            return
+        if self.disk_filters:
+            # check the name before splitting all of the stats
+            name = line.split(None, 1)[:1]
+            if not name or not self.accept_disk(name[0]):
+                return
         s = line.split()
-        stat = {s[0]: [float(i) for i in s[1:]]}
-        self.device_stat['stats'].append(stat)
+        if not s:
+            return
+        values = [float(i) for i in s[1:]]
+        if len(values) != self.device_width:
+            log.debug('broken device line: %s', line)
+            return
+        self.store.add_device(s[0], values)
+
+    def parse_cpu_block(self, block):
+        for line in block.split(b'\n'):
+            if line:
+                self.parse_cpu_stat(line)
+
+    def parse_device_block(self, block):
+        if self.row is None or not self.store.has_device:
+            return
+        width = self.device_width + 1
+        tokens = block.split()
+        if len(tokens) % width != 0:
+            # some lines are broken, fall back to line by line
+            for line in block.split(b'\n'):
+                self.parse_device_stat(line.decode())
+            return
+
+        names = [self.decode_name(i) for i in tokens[::width]]
+        if self.disk_filters:
+            # only convert stats of the selected disks
+            selected = [i for i, name in enumerate(names) if name is not None]
+            names = [names[i] for i in selected]
+            tokens = [t for i in selected
+                      for t in tokens[i * width:(i + 1) * width]]
+        if not names:
+            return
+        del tokens[::width]
+        values = np.array(list(map(float, tokens))).reshape(-1, width - 1)
+        self.store.add_devices(names, values)
 
-    def parse_columns(self, d, line):
-        d['columns'] = line.strip().split()[1:]
+    def decode_name(self, name):
+        """
+        return decoded disk name, or None when the disk is filtered out
+        """
+        try:
+            return self.names[name]
+        except KeyError:
+            decoded = name.decode()
+            if not self.accept_disk(decoded):
+                decoded = None
+            self.names[name] = decoded
+            return decoded
+
+    def _parse_token(self, token, value):
+        if token == DATE:
+            if self.row is not None:
+                yield self.row
+
+            self.row = None
+            self.skipping = not self.accept_date(value)
+            if not self.skipping:
+                self.row = self.store.add_date(value)
+            elif self.should_stop(value):
+                self.finished = True
+            self.state = self.DATE
+        elif token == CPU_HEADER:
+            self.cpu_width = len(value)
+            self.store.set_cpu_columns(value)
+            self.state = self.CPU
+        elif token == DEVICE_HEADER:
+            self.device_width = len(value)
+            self.store.set_device_columns(value)
+            self.state = self.DEVICE
+        else:
+            log.debug('not handled line: %s', value)
+            self.extra_lines.append(value)
 
     def _parse(self, line):
         if line == '\n':
             self.state = None
             return
 
-        line = line.strip()
-        if self.state == self.CPU:
-            self.parse_cpu_stat(line)
-        elif self.state == self.DEVICE:
+        if self.state == self.DEVICE:
             self.parse_device_stat(line)
+        elif self.state == self.CPU:
+            self.parse_cpu_stat(line)
         else:
-            date_format = get_iostat_date_format(line)
-            if date_format is not None:
-                if self.date is not None:
-                    yield self.make_stat()
-
-                self.init_stat()
-                self.date = parse_datetime(line, fmt=date_format)
-                self.state = self.DATE
-            else:
-                if line.startswith('avg-cpu:'):
-                    self.parse_columns(self.cpu_stat, line)
-                    self.state = self.CPU
-                elif line.startswith('Device'):
-                    self.parse_columns(self.device_stat, line)
-                    self.state = self.DEVICE
-                else:
-                    log.debug('not handled line: %s', line)
-                    self.extra_lines.append(line)
+            yield from self._parse_token(*self.tokenizer.tokenize(line))
+
+    def _parse_block(self, block):
+        """
+        parse a block of lines between blank lines, stat lines after
+        a header are converted at once without decoding
+        """
+        self.state = None
+        while block:
+            line, _, block = block.partition(b'\n')
+            if not line:
+                continue
+            line = line.decode()
+            yield from self._parse_token(*self.tokenizer.tokenize(line))
+            if self.finished:
+                break
+            if self.state == self.CPU:
+                self.parse_cpu_block(block)
+                break
+            elif self.state == self.DEVICE:
+                self.parse_device_block(block)
+                break
 
     def parse_line(self, line):
-        yield from self._parse(line)
+        """
+        parse a line of live output, the store keeps only the snapshot
+        being parsed, so memory usage doesn't grow with uptime
+        """
+        for row in self._parse(line):
+            stat = self.store.get_stat(row)
+            # the next snapshot is not added until this row is yielded
+            self.store.clear()
+            yield stat
+
+    def parse_text(self, start=0, compression=None):
+        # the end of the range is found by the until filter
+        with open_data(self.args.data, compression) as f:
+            if start > 0:
+                f.seek(start)
+            # keep the wrapper, it closes the file when it's released
+            text = io.TextIOWrapper(f)
+            for line in text:
+                yield from self._parse(line)
+                if self.finished:
+                    break
+            PROFILER.add_bytes(f.tell() - start)
+
+    def parse_mmap(self, start=0, end=None):
+        with open(self.args.data, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                if end is None:
+                    end = len(m)
+                first = start
+                while start < end and not self.finished:
+                    block_end = m.find(b'\n\n', start, end)
+                    if block_end == -1:
+                        block_end = end
+                    if self.skipping and not m[start:start + 1].isdigit():
+                        # skip stat blocks of a filtered out record
+                        # without copying them out of the map
+                        start = block_end + 2
+                        continue
+                    yield from self._parse_block(m[start:block_end])
+                    start = block_end + 2
+                PROFILER.add_bytes(min(start, end) - first)
+
+    def parse_appended(self):
+        """
+        parse bytes appended to the file since the last call
+
+        The state and the file offset are kept across calls, and a partial
+        last line is kept until the rest of it is written. Like parse_all,
+        this yields the row of a snapshot when the next timestamp comes.
+        """
+        with open(self.args.data, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            if size < self.offset:
+                log.info('file was truncated, read from the beginning')
+                self.offset = 0
+                self.partial_line = b''
+                self.state = None
+            f.seek(self.offset)
+            data = f.read(size - self.offset)
+        self.offset += len(data)
+
+        lines = (self.partial_line + data).split(b'\n')
+        self.partial_line = lines.pop()
+        for line in lines:
+            if self.finished:
+                break
+            yield from self._parse(line.rstrip(b'\r').decode() + '\n')
 
     def parse_all(self):
         if not os.path.isfile(self.args.data):
             log.error('target file is not found: %s', self.args.data)
             return
 
-        with open(self.args.data) as f:
+        compression = self.compression
+        if compression is not None:
+            # compressed data is decompressed while parsing it as a stream
+            try:
+                yield from self.parse_text(compression=compression)
+            except RuntimeError as e:
+                log.error(e)
+                return
+        else:
+            start, end = self.find_range()
+            if start > 0:
+                self.parse_header()
+            # blocks are split on LF, CRLF is converted while reading text
+            if self.args.mmap and not has_carriage_return(self.args.data):
+                yield from self.parse_mmap(start, end)
+            else:
+                yield from self.parse_text(start)
+        yield from self.flush()
+
+    @property
+    def compression(self):
+        if not os.path.isfile(self.args.data):
+            return None
+        return get_compression(self.args.data)
+
+    def flush(self):
+        """
+        yield the row of the last snapshot, it's not yielded until the next
+        timestamp comes or the end of the output is known
+        """
+        if self.row is not None:
+            yield self.row  # last stat data
+            self.row = None
+
+    def parse_header(self):
+        """
+        parse lines before the first record, e.g.) "Linux ..." line,
+        which are skipped when the range is read by the index
+        """
+        with open(self.args.data, 'rb') as f:
             for line in f:
-                yield from self._parse(line)
-            yield self.make_stat()  # last stat data
+                line = line.rstrip(b'\r\n').decode() + '\n'
+                if self.tokenizer.tokenize(line)[0] == DATE:
+                    break
+                for _ in self._parse(line):
+                    pass
+
+    def find_range(self):
+        """
+        return byte range of the file to read for --since and --until
+        """
+        if not self.args.use_index:
+            return 0, None
+        if self.args.since is None and self.args.until is None:
+            return 0, None
+        if has_carriage_return(self.args.data):
+            log.debug('index is not used for CRLF line endings')
+            return 0, None
+
+        from .index import get_index
+        start, end = get_index(self.args.data).find_range(
+            self.args.since, self.args.until)
+        log.debug('read range by index: %d-%d', start, end)
+        return start, end
+
+    def accept_date(self, date):
+        for filter_func in self.date_filters:
+            if not filter_func(date):
+                return False
+        return True
+
+    def should_stop(self, date):
+        for filter_func in self.stop_filters:
+            if filter_func(date):
+                return True
+        return False
 
-    def filter(self, stat):
-        for filter_func in self.filters:
-            if not filter_func(stat):
+    def accept_disk(self, name):
+        for filter_func in self.disk_filters:
+            if not filter_func(name):
                 return False
         return True
 
     def parse(self):
-        for stat in self.parse_all():
-            if self.filter(stat):
-                yield stat
+        for row in self.parse_all():
+            yield self.store.get_stat(row)
+
+    def parse_batches(self, size):
+        """
+        yield the store for every given number of snapshots and clear it
+        after that, so memory usage stays flat however long the output is
+        """
+        for _ in self.parse_all():
+            # the next snapshot is not added until this row is yielded
+            if len(self.store) >= size:
+                PROFILER.add_records(self.store)
+                yield self.store
+                self.store.clear()
+        if len(self.store) > 0:
+            PROFILER.add_records(self.store)
+            yield self.store
+
+    def load(self):
+        with stage('parse'), PROFILER.load():
+            self._load()
+        PROFILER.add_records(self.store)
+        return self.store
+
+    def _load(self):
+        if len(self.args.data_files) > 1:
+            load_files(self, self.args.jobs)
+            return
+
+        if self.args.cache_dir is not None:
+            from .cache import load_cached
+            load_cached(self)
+            return
+
+        if (self.args.jobs > 1 and self.compression is None
+                and not has_carriage_return(self.args.data)):
+            from .parallel import load_parallel
+            load_parallel(self, self.args.jobs)
+            return
+
+        for _ in self.parse_all():
+            pass
@@ -1,25 +1,41 @@
 import math
-from collections import defaultdict
 
+import numpy as np
 from matplotlib import dates as mdates
 from matplotlib import gridspec
 from matplotlib import pyplot as plt
+from matplotlib import ticker
 
 from .consts import AVGRQ_SZ, AVGQU_SZ, AWAIT, SVCTM
+from .consts import DEVICE_SUBPLOT_COLUMNS
 from .consts import IO_RQM, IOPS, IO_TRANSFER, PERCENT_UTIL
 from .consts import PERCENT_IO_RQM
+from .consts import RESAMPLE_AUTO
 from .renderer import Renderer
-from .utils import get_logger
+from .resample import get_auto_bucket, resample
+from .store import StatStore
+from .utils import format_elapsed, get_logger
 
 log = get_logger()
 default_figsize = plt.rcParams.get('figure.figsize')
 
 
+def make_store(args):
+    """
+    make a store which keeps only the stats to plot
+    """
+    columns = []
+    if not args.cpu_only:
+        for name in args.subplots:
+            columns.extend(DEVICE_SUBPLOT_COLUMNS[name])
+    return StatStore(keep_cpu=args.with_cpu, keep_device_columns=columns)
+
+
 class Plotter(Renderer):
 
-    def __init__(self, args, stats):
+    def __init__(self, args, store):
         self.args = args
-        self.stats = stats
+        self.store = store
         self.subplot_borderaxespad = -1
 
         figsize = args.figsize
@@ -69,15 +85,19 @@ class Plotter(Renderer):
     def _update_args_subplots(self):
         if self.args.cpu_only:
             return
-        if not self.has_stat_data('device'):
+        if PERCENT_IO_RQM not in self.args.subplots:
+            return
+        if not self.store.has_device:
             return
-        columns = self.stats[0]['device']['columns']
+        columns = self.store.device_columns
         # TODO: check stats columns for all cases
         #       only PERCENT_IO_RQM in new iostat outputs at this time
         for col in ['%rrqm', '%wrqm']:
             if col in columns:
                 return
-        self.args.subplots.remove(PERCENT_IO_RQM)
+        self.args.subplots = [
+            i for i in self.args.subplots if i != PERCENT_IO_RQM
+        ]
 
     def set_device_subplot_params(self, name, subplot):
         if name == IO_RQM:
@@ -110,83 +130,74 @@ class Plotter(Renderer):
         else:
             raise NotImplementedError('unsupported subplot: %s' % name)
 
-    def has_stat_data(self, target):
-        return self.stats[0][target]['columns'] is not None
+    def get_bucket(self, subplot, timestamps):
+        if self.args.resample == RESAMPLE_AUTO:
+            pixels = int(subplot.get_window_extent().width)
+            return get_auto_bucket(timestamps, pixels)
+        elif self.args.resample is None:
+            return 0
+        return self.args.resample
+
+    def plot_series(self, subplot, timestamps, values, label, **kwargs):
+        """
+        plot values, or the mean and min/max envelope in time buckets
+        when there are more values than the resolution, and return the line
+        """
+        bucket = self.get_bucket(subplot, timestamps)
+        if bucket == 0 or len(timestamps) == 0:
+            x = timestamps.astype('datetime64[s]')
+            line, = subplot.plot(x, values, label=label, **kwargs)
+            return line
+
+        timestamps, mins, maxs, means = resample(timestamps, values, bucket)
+        x = timestamps.astype('datetime64[s]')
+        line, = subplot.plot(x, means, label=label, **kwargs)
+        subplot.fill_between(
+            x, mins, maxs, color=line.get_color(), alpha=0.3, linewidth=0,
+        )
+        return line
 
     def plot_cpu(self, x):
-        if not self.has_stat_data('cpu'):
+        if not self.store.has_cpu:
             return
 
-        data = defaultdict(list)
-        for stat in self.stats:
-            cpu = stat['cpu']
-            for i, column in enumerate(cpu['columns']):
-                data[column].append(cpu['stat'][i])
-
-        for column, values in data.items():
-            self.cpu.plot(x, values, label=column)
+        cpu = self.store.cpu_matrix()
+        for i, column in enumerate(self.store.cpu_columns):
+            self.plot_series(self.cpu, x, cpu[:, i], column)
 
         for vline in self.args.vlines:
             self.cpu.axvline(vline, linestyle=':', linewidth=3, color='purple')
         self.cpu.legend(
             bbox_to_anchor=(1.04, 0.5), loc='center left', borderaxespad=-3)
 
-    def set_device_data(self, data, device):
-        def set_data_value(data, columns, disk_stat_data):
-            for col in columns:
-                value = disk_stat_data.get(col)
-                if value is not None:
-                    data[name][disk_name + '_' + col].append(value)
-
-        _disk_stat_data = {}
-        for disk in device['stats']:
-            for disk_name, disk_stat in disk.items():
-                for i, column in enumerate(device['columns']):
-                    _disk_stat_data[column] = disk_stat[i]
-                for name in data:
-                    if name == IO_RQM:
-                        columns = ['rrqm/s', 'wrqm/s']
-                    elif name == PERCENT_IO_RQM:
-                        columns = ['%rrqm', '%wrqm']
-                    elif name == IOPS:
-                        columns = ['r/s', 'w/s']
-                    elif name == IO_TRANSFER:
-                        columns = [
-                            'rMB/s', 'wMB/s',    # iostat -m
-                            'rkB/s', 'wkB/s',    # iostat -k
-                            'rsec/s', 'wsec/s',  # by default
-                        ]
-                    elif name == PERCENT_UTIL:
-                        columns = ['%util']
-                    elif name == AVGRQ_SZ:
-                        columns = [
-                            'avgrq-sz', 'areq-sz', 'rareq-sz', 'wareq-sz'
-                        ]
-                    elif name == AVGQU_SZ:
-                        columns = ['avgqu-sz', 'aqu-sz']
-                    elif name == AWAIT:
-                        columns = ['await', 'r_await', 'w_await']
-                    elif name == SVCTM:
-                        columns = ['await', 'svctm']
-                    else:
-                        assert False
-                    set_data_value(data, columns, _disk_stat_data)
+    def resolve_subplot_columns(self):
+        """
+        map each subplot to (column, index) pairs in the device header
+        """
+        indexes = {c: i for i, c in enumerate(self.store.device_columns)}
+        subplot_columns = {}
+        for name in self.subplots:
+            subplot_columns[name] = [
+                (column, indexes[column])
+                for column in DEVICE_SUBPLOT_COLUMNS[name]
+                if column in indexes
+            ]
+        return subplot_columns
 
     def plot_device(self, x):
-        if not self.has_stat_data('device'):
+        if not self.store.has_device:
             return
 
-        data = {}
-        for name in self.subplots:
-            data[name] = defaultdict(list)
-
-        for stat in self.stats:
-            self.set_device_data(data, stat['device'])
-
-        for name, device_data in data.items():
-            for column, values in device_data.items():
-                self.subplots[name].plot(x, values, label=column)
+        subplot_columns = self.resolve_subplot_columns()
+        for disk_name, rows, values in self.store.iter_devices():
+            for name, columns in subplot_columns.items():
+                for column, index in columns:
+                    self.plot_series(
+                        self.subplots[name], x[rows], values[:, index],
+                        disk_name + '_' + column,
+                    )
 
+        for name in self.subplots:
             for vline in self.args.vlines:
                 self.subplots[name].axvline(
                     vline, linestyle=':', linewidth=3, color='purple',
@@ -197,11 +208,11 @@ class Plotter(Renderer):
             )
 
     def plot(self):
-        datetime_data = [i['date'] for i in self.stats]
+        timestamps = self.store.timestamps()
         if not self.args.cpu_only:
-            self.plot_device(datetime_data)
+            self.plot_device(timestamps)
         if self.args.with_cpu:
-            self.plot_cpu(datetime_data)
+            self.plot_cpu(timestamps)
         if not self.args.cpu_only and self.args.with_cpu:
             plt.subplots_adjust(hspace=0.4)
 
@@ -210,3 +221,46 @@ class Plotter(Renderer):
 
     def save(self):
         plt.savefig(self.output)
+
+
+class ComparePlotter(Plotter):
+    """
+    Overlay captures on the elapsed time from the first snapshot of each,
+    a series has the same color in all captures and a line style for each
+    """
+
+    def __init__(self, args, stores):
+        from .compare import LINESTYLES
+        # datetimes of a capture are not in the others
+        args.vlines = []
+        super().__init__(args, stores[0][1])
+        self.stores = list(zip(stores, LINESTYLES))
+        self.label = None
+        self.linestyle = None
+        self.colors = {}
+
+        if args.x_datetime_format is None:
+            origin = mdates.date2num(np.datetime64(0, 's'))
+            formatter = ticker.FuncFormatter(
+                lambda x, pos: format_elapsed((x - origin) * 86400))
+            for subplot in self.fig.axes:
+                subplot.xaxis.set_major_formatter(formatter)
+                subplot.set_xlabel('elapsed time')
+
+    def plot_series(self, subplot, timestamps, values, label, **kwargs):
+        key = (subplot, label)
+        kwargs.setdefault('linestyle', self.linestyle)
+        if key in self.colors:
+            kwargs.setdefault('color', self.colors[key])
+        line = super().plot_series(
+            subplot, timestamps, values, '%s %s' % (self.label, label),
+            **kwargs)
+        self.colors.setdefault(key, line.get_color())
+        return line
+
+    def plot(self):
+        for (label, store), linestyle in self.stores:
+            self.store = store
+            self.label = label
+            self.linestyle = linestyle
+            super().plot()
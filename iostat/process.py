@@ -1,93 +1,363 @@
 """
-Running process asynchronously supports over Python 3.4,
-so use generator based coroutine instead of native coroutine (async/await)
+Run iostat commands and read their output with asyncio
+
+The output of each source, e.g.) iostat on a remote host via ssh or
+a recorded iostat output to replay, is passed through a bounded queue with
+its tag, the reader waits for new lines and the sources wait for the reader
+when the queue is full, so no line is dropped. Parsing and rendering run
+in another process.
 """
+import argparse
 import asyncio
 import asyncio.subprocess
+import multiprocessing
+import os
+import signal
+from contextlib import ExitStack
+from functools import partial
+from queue import Empty
 
+from .csv import write_store_csv
+from .detect import EPISODE_START, Detector
 from .parser import Parser
-from .scatter import Scatter
-from .utils import get_logger
+from .ring import History
+from .tokenizer import Tokenizer
+from .utils import add_suffix_to_name, get_logger
 
 log = get_logger()
 
+# message to the render process to export snapshots in the window
+EXPORT = b'export'
 
-async def run_process(future, command_and_args, queue):
-    create = asyncio.create_subprocess_exec(
-        *command_and_args,
-        stdout=asyncio.subprocess.PIPE,
-        stderr=asyncio.subprocess.STDOUT
-    )
-    proc = await create
-    while True:
-        line = await proc.stdout.readline()
-        if queue.full():
-            await asyncio.sleep(1)
+# seconds to wait for a source process to exit after terminating it
+TERMINATE_TIMEOUT = 5.0
+
+
+def get_tagged_path(path, tag):
+    """
+    >>> get_tagged_path('iostat.log', None)
+    'iostat.log'
+    >>> get_tagged_path('iostat.log', 'node1')
+    'iostat_node1.log'
+    """
+    if tag is None:
+        return path
+    return add_suffix_to_name(path, tag)
+
+
+def get_sources(args):
+    """
+    return (tag, reader) of each source, the reader is a coroutine function
+    to put lines to the queue. The tag is None for a single source to keep
+    output file names.
+
+    >>> args = argparse.Namespace(
+    ...     sources=None, replays=None, iostat_args='-xt 1', speed=1.0)
+    >>> [tag for tag, _ in get_sources(args)]
+    [None]
+    >>> args.sources = [('node1', ['ssh', 'node1', 'iostat'])]
+    >>> args.replays = ['path/to/node2.log']
+    >>> [tag for tag, _ in get_sources(args)]
+    ['node1', 'source2']
+    """
+    readers = []
+    for tag, command_and_args in args.sources or []:
+        readers.append((tag, partial(run_process, command_and_args)))
+    for path in args.replays or []:
+        readers.append((None, partial(replay_file, path, args.speed)))
+    if not readers:
+        command_and_args = ['iostat'] + args.iostat_args.split()
+        readers.append((None, partial(run_process, command_and_args)))
+    if len(readers) == 1:
+        return readers
+
+    sources = []
+    for i, (tag, reader) in enumerate(readers, 1):
+        if tag is None:
+            tag = 'source%d' % i
+        sources.append((tag, reader))
+    return sources
+
+
+def is_same_file(path1, path2):
+    if os.path.exists(path1) and os.path.exists(path2):
+        return os.path.samefile(path1, path2)
+    return os.path.realpath(path1) == os.path.realpath(path2)
+
+
+def find_replayed_output(args, tags):
+    """
+    return the replayed file which is also an output file, it would be
+    truncated before it's replayed
+
+    >>> args = argparse.Namespace(output='iostat.log', replays=['iostat.log'])
+    >>> find_replayed_output(args, [None])
+    'iostat.log'
+    >>> find_replayed_output(args, ['node1'])
+    """
+    outputs = [get_tagged_path(args.output, tag) for tag in tags]
+    for path in args.replays or []:
+        for output in outputs:
+            if is_same_file(path, output):
+                return path
+    return None
+
+
+async def run_process(command_and_args, tag, queue):
+    """
+    put each line of the process output to the queue with the tag,
+    and None at the end, return the status code
+    """
+    try:
+        proc = await asyncio.create_subprocess_exec(
+            *command_and_args,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.STDOUT
+        )
+    except OSError as e:
+        log.error('failed to run %s: %s', command_and_args[0], e)
+        await queue.put((tag, None))
+        # the status code of a shell for a command which is not found
+        return 127
+    try:
+        while True:
+            line = await proc.stdout.readline()
+            if not line:
+                break
+            # wait for the reader instead of dropping lines when it's full
+            await queue.put((tag, line))
+        await queue.put((tag, None))
+        return await proc.wait()
+    finally:
+        if proc.returncode is None:
+            proc.terminate()
+            # wait for the process not to leave it to the closed loop
+            try:
+                await asyncio.wait_for(proc.wait(), TERMINATE_TIMEOUT)
+            except asyncio.TimeoutError:
+                proc.kill()
+                await proc.wait()
+
+
+async def replay_file(path, speed, tag, queue):
+    """
+    put each line of recorded iostat output to the queue like run_process
+
+    Snapshots are put in the time scaled by the speed from the first one,
+    or as fast as possible when the speed is 0.
+    """
+    tokenizer = Tokenizer()
+    loop = asyncio.get_running_loop()
+    started_at = loop.time()
+    first_date = None
+    lines = 0
+    with open(path, 'rb') as f:
+        for line in f:
+            if speed > 0 and line[:1].isdigit():
+                date = tokenizer.parse_date(line.decode())
+                if date is not None and first_date is None:
+                    first_date = date
+                elif date is not None:
+                    elapsed = (date - first_date).total_seconds() / speed
+                    delay = started_at + elapsed - loop.time()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+            await queue.put((tag, line))
+            lines += 1
+    await queue.put((tag, None))
+    log.info('replayed %d lines in %.3f seconds: %s',
+             lines, loop.time() - started_at, path)
+    return 0
+
+
+async def get_lines(queue):
+    """
+    return all (tag, line) in the queue, wait for one if it's empty
+    """
+    lines = [await queue.get()]
+    while not queue.empty():
+        lines.append(queue.get_nowait())
+    return lines
+
+
+def echo(tag, output):
+    text = output.decode()
+    if tag is not None:
+        text = ''.join('[%s] %s' % (tag, line)
+                       for line in text.splitlines(keepends=True))
+    print(text, end='', flush=True)
+
+
+def export_window(args, history, tag):
+    export_args = argparse.Namespace(**vars(args))
+    export_args.output = get_tagged_path(args.window_output, tag)
+    write_store_csv(export_args, history.to_store())
+    log.info('exported snapshots in the window: %s', export_args.output)
+
+
+def log_saturation(events, tag):
+    prefix = '' if tag is None else '[%s] ' % tag
+    for event, episode in events:
+        if event == EPISODE_START:
+            log.warning('%ssaturation started: %s', prefix, episode.format())
         else:
-            queue.put_nowait(line)
+            log.warning('%ssaturation ended: %s', prefix, episode.format())
 
-        # check process is finished or not,
-        # but it might not occurred immediately
-        # in that case, proc.stdout.readline() might return empty line
-        # during several seconds
-        if proc.returncode is not None:
-            break
 
-    future.set_result(proc.returncode)
+def render_stream(args, tags, render_queue):
+    """
+    parse and render batches of iostat output in the render process
 
+    All sources are rendered in one figure with a parser for each of them.
+    The capture process sends None at the end, so SIGINT is ignored here
+    to parse and save all of the output.
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    import matplotlib
+    matplotlib.use(args.backend)
+    from .scatter import Scatter
 
-async def read_stream(queue, args):
-    parser = Parser(args)
-    scatter = Scatter(args)
-    with open(args.output, 'wb') as f:
-        try:
-            while True:
-                if queue.empty():
-                    await asyncio.sleep(1)
-                else:
-                    # TODO: it might miss rest of last queue entries
-                    #       when the process finished
-                    output = queue.get_nowait()
-                    f.write(output)
-                    line = output.decode()
-                    print(line.rstrip())
+    parsers = {tag: Parser(args) for tag in tags}
+    histories = {tag: History(*args.window) for tag in tags}
+    detectors = {tag: Detector(args) for tag in tags if args.detect}
+    scatter = Scatter(args, histories, live=True)
+    try:
+        while True:
+            try:
+                message = render_queue.get(
+                    timeout=scatter.get_redraw_timeout())
+            except Empty:
+                # draw the skipped snapshots and keep the figure responsive
+                # while no output comes
+                scatter.redraw_pending()
+                continue
+            if message is None:
+                break
+            if message == EXPORT:
+                for tag, history in histories.items():
+                    export_window(args, history, tag)
+                continue
+
+            tag, output = message
+            parser = parsers[tag]
+            for line in output.decode().splitlines(keepends=True):
+                for stat in parser.parse_line(line):
+                    # note: get stat for previous date entry
+                    scatter.scatter(stat, tag)
+                    if tag in detectors:
+                        log_saturation(detectors[tag].add_stat(stat), tag)
+
+        for tag, parser in parsers.items():
+            for row in parser.flush():
+                stat = parser.store.get_stat(row)
+                scatter.scatter(stat, tag)
+                if tag in detectors:
+                    log_saturation(detectors[tag].add_stat(stat), tag)
+        for tag, detector in detectors.items():
+            log_saturation(detector.flush(), tag)
+    finally:
+        if args.backend == 'Agg':
+            scatter.save()
+
+
+def start_renderer(args, tags):
+    # spawn not to share the state of GUI toolkit with the capture process
+    context = multiprocessing.get_context('spawn')
+    render_queue = context.Queue()
+    renderer = context.Process(
+        target=render_stream, args=(args, tags, render_queue),
+        name='renderer',
+    )
+    renderer.start()
+    return renderer, render_queue
 
-                    for stat in parser.parse_line(line):
-                        # note: get stat for previous date entry
-                        if parser.filter(stat):
-                            scatter.scatter(stat)
-        except Exception:
-            if args.backend == 'Agg':
-                scatter.save()
 
+async def read_stream(queue, args, tags):
+    """
+    save and echo output of all sources, and pass it to the render process
 
-def cancel_tasks():
-    # TODO: confirm detailed behavior
-    for task in asyncio.Task.all_tasks():
-        task.cancel()
+    Rendering never blocks this loop, so a slow redraw doesn't make gaps
+    in the saved output.
+    """
+    renderer, render_queue = start_renderer(args, tags)
+    if hasattr(signal, 'SIGUSR1'):
+        asyncio.get_event_loop().add_signal_handler(
+            signal.SIGUSR1, render_queue.put, EXPORT)
+    with ExitStack() as stack:
+        files = {
+            tag: stack.enter_context(
+                open(get_tagged_path(args.output, tag), 'wb'))
+            for tag in tags
+        }
 
+        def write(lines):
+            """
+            save, echo and render lines, return number of finished sources
+            """
+            finished = 0
+            # keep lines of each source in order of arrival
+            outputs = {}
+            for tag, line in lines:
+                if line is None:
+                    finished += 1
+                else:
+                    outputs.setdefault(tag, []).append(line)
 
-def finish_tasks(future):
-    status_code = future.result()
-    if status_code != 0:
-        log.error('process was not finished normally: %d', status_code)
-    cancel_tasks()
+            for tag, lines in outputs.items():
+                output = b''.join(lines)
+                files[tag].write(output)
+                files[tag].flush()
+                echo(tag, output)
+                if renderer.is_alive():
+                    render_queue.put((tag, output))
+            return finished
+
+        try:
+            running = len(tags)
+            while running:
+                running -= write(await get_lines(queue))
+        finally:
+            # save the lines already read when it's interrupted
+            lines = []
+            while not queue.empty():
+                lines.append(queue.get_nowait())
+            write(lines)
+            render_queue.put(None)
+            renderer.join()
+
+
+async def monitor(sources, args):
+    queue = asyncio.Queue(maxsize=args.max_queue_size)
+    processes = [
+        asyncio.create_task(reader(tag, queue)) for tag, reader in sources
+    ]
+    try:
+        await read_stream(queue, args, [tag for tag, _ in sources])
+    except BaseException:
+        # stop the sources still running, e.g.) on SIGINT, and wait for
+        # them before the loop is closed
+        for process in processes:
+            process.cancel()
+        await asyncio.gather(*processes, return_exceptions=True)
+        raise
+    return await asyncio.gather(*processes, return_exceptions=True)
 
 
 def run_iostat(args):
-    command_and_args = ['iostat'] + args.iostat_args.split()
-    log.debug(command_and_args)
-    event_loop = asyncio.get_event_loop()
-    future = asyncio.Future()
-    queue = asyncio.Queue(maxsize=args.max_queue_size, loop=event_loop)
-    asyncio.ensure_future(run_process(future, command_and_args, queue))
-    future.add_done_callback(finish_tasks)
+    sources = get_sources(args)
+    log.debug(sources)
+    path = find_replayed_output(args, [tag for tag, _ in sources])
+    if path is not None:
+        log.error('replayed file is also the output, set another '
+                  '--output not to overwrite it: %s', path)
+        return
     try:
-        event_loop.run_until_complete(read_stream(queue, args))
-        event_loop.run_forever()
+        status_codes = asyncio.run(monitor(sources, args))
     except KeyboardInterrupt:
-        cancel_tasks()
-    except asyncio.CancelledError:
-        pass
-    finally:
-        event_loop.close()
+        return
+    for (tag, _), status_code in zip(sources, status_codes):
+        if isinstance(status_code, BaseException):
+            log.error('failed to read the source: %s (%s)', status_code, tag)
+        elif status_code != 0:
+            log.error('process was not finished normally: %d (%s)',
+                      status_code, tag)
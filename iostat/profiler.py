@@ -0,0 +1,165 @@
+"""
+Measure time of each stage, e.g.) parse, plot and savefig, with --profile
+
+Stages can be nested and the time of a stage doesn't include the stages
+in it, so the stages add up to the total. They're measured in this
+process only, the time spent in worker processes is counted in the stage
+waiting for them.
+"""
+import cProfile
+import sys
+import time
+from contextlib import contextmanager
+
+from .utils import get_logger
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+log = get_logger()
+
+
+def get_peak_rss(who):
+    """
+    return peak resident set size in bytes, or None if it's unknown
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(who).ru_maxrss
+    # kilobytes on Linux and bytes on macOS
+    if sys.platform != 'darwin':
+        peak *= 1024
+    return peak
+
+
+class Profiler:
+    """
+    >>> profiler = Profiler()
+    >>> profiler.enable()
+    >>> with profiler.stage('parse'):
+    ...     with profiler.stage('filter'):
+    ...         pass
+    >>> sorted(profiler.times)
+    ['filter', 'parse']
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.started_at = None
+        self.times = {}
+        self.stack = []
+        self.bytes = 0
+        self.snapshots = 0
+        self.records = 0
+        self.loading = 0
+        self.cprofile = None
+
+    def enable(self, cprofile=False):
+        self.enabled = True
+        self.started_at = time.perf_counter()
+        if cprofile:
+            self.cprofile = cProfile.Profile()
+            self.cprofile.enable()
+
+    def add_time(self, name, seconds):
+        self.times[name] = self.times.get(name, 0.0) + seconds
+
+    def pause(self, now):
+        """
+        add time of the current stage until now
+        """
+        if self.stack:
+            name, resumed_at = self.stack[-1]
+            self.add_time(name, now - resumed_at)
+
+    @contextmanager
+    def stage(self, name):
+        if not self.enabled:
+            yield
+            return
+        now = time.perf_counter()
+        self.pause(now)
+        self.stack.append((name, now))
+        try:
+            yield
+        finally:
+            now = time.perf_counter()
+            self.pause(now)
+            self.stack.pop()
+            if self.stack:
+                self.stack[-1] = (self.stack[-1][0], now)
+
+    def add_bytes(self, size):
+        if self.enabled:
+            self.bytes += size
+
+    @contextmanager
+    def load(self):
+        """
+        count records of the outermost load only, e.g.) a load of several
+        files loads each of them in it
+        """
+        self.loading += 1
+        try:
+            yield
+        finally:
+            self.loading -= 1
+
+    def add_records(self, store):
+        if self.enabled and self.loading == 0:
+            self.snapshots += len(store)
+            self.records += len(store.device_rows)
+
+    def format_report(self):
+        total = time.perf_counter() - self.started_at
+        lines = ['profile:', '%-12s %10s %8s' % ('stage', 'seconds', '%')]
+        for name, seconds in self.times.items():
+            lines.append('%-12s %10.3f %7.1f%%' % (
+                name, seconds, seconds / total * 100))
+        other = total - sum(self.times.values())
+        lines.append('%-12s %10.3f %7.1f%%' % (
+            'other', other, other / total * 100))
+        lines.append('%-12s %10.3f' % ('total', total))
+
+        parse = self.times.get('parse')
+        records = self.snapshots + self.records
+        mib = self.bytes / (1 << 20)
+        # bytes and records parsed in worker processes are not counted
+        line = 'input: %.1f MiB' % mib
+        if records > 0:
+            line += ', %d snapshots, %d device records' % (
+                self.snapshots, self.records)
+        if parse:
+            line += ' (%.1f MiB/s' % (mib / parse)
+            if records > 0:
+                line += ', %.0f records/s' % (records / parse)
+            line += ' in parse)'
+        lines.append(line)
+
+        peak = get_peak_rss(resource.RUSAGE_SELF) if resource else None
+        if peak is not None:
+            children = get_peak_rss(resource.RUSAGE_CHILDREN)
+            lines.append('peak rss: %.1f MiB (children %.1f MiB)' % (
+                peak / (1 << 20), children / (1 << 20)))
+        return '\n'.join(lines)
+
+    def report(self, output=None):
+        """
+        print time of each stage to stderr and dump cProfile stats
+        """
+        if not self.enabled:
+            return
+        if self.cprofile is not None:
+            self.cprofile.disable()
+            try:
+                self.cprofile.dump_stats(output)
+                log.info('saved cProfile stats: %s', output)
+            except OSError as e:
+                log.error('failed to save cProfile stats: %s', e)
+        print(self.format_report(), file=sys.stderr)
+
+
+PROFILER = Profiler()
+stage = PROFILER.stage
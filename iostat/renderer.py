@@ -1,5 +1,6 @@
 import matplotlib.pyplot as plt
 
+from .profiler import stage
 from .utils import make_output_file
 
 
@@ -26,7 +27,9 @@ class Renderer:
 
     def render(self):
         if self.args.backend == 'Agg':
-            self.save()
+            # the figure is drawn in savefig
+            with stage('savefig'):
+                self.save()
         else:
             self.show()
         plt.close(self.fig)
@@ -0,0 +1,49 @@
+import math
+
+import numpy as np
+
+
+def get_auto_bucket(timestamps, pixels):
+    """
+    return bucket size in seconds to draw at most one bucket per pixel,
+    or 0 when the series fits in pixels
+
+    >>> get_auto_bucket(np.arange(100), 200)
+    0
+    >>> get_auto_bucket(np.arange(0, 604800), 1000)
+    605
+    """
+    if len(timestamps) <= pixels or pixels <= 0:
+        return 0
+    span = int(timestamps[-1]) - int(timestamps[0])
+    return max(1, math.ceil(span / pixels))
+
+
+def resample(timestamps, values, bucket):
+    """
+    aggregate values into time buckets of the given seconds,
+    NaN values are ignored
+
+    return (bucket timestamps, min, max, mean) for each bucket
+
+    >>> t = np.array([0, 1, 2, 3, 10])
+    >>> v = np.array([1.0, 5.0, 2.0, np.nan, 4.0])
+    >>> [i.tolist() for i in resample(t, v, 2)]
+    [[0, 2, 10], [1.0, 2.0, 4.0], [5.0, 2.0, 4.0], [3.0, 2.0, 4.0]]
+    """
+    if len(timestamps) > 1 and np.any(np.diff(timestamps) < 0):
+        order = np.argsort(timestamps, kind='stable')
+        timestamps, values = timestamps[order], values[order]
+
+    base = timestamps[0]
+    index = (timestamps - base) // bucket
+    starts = np.flatnonzero(np.diff(index, prepend=index[0] - 1))
+
+    valid = ~np.isnan(values)
+    counts = np.add.reduceat(valid, starts)
+    sums = np.add.reduceat(np.where(valid, values, 0.0), starts)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = sums / counts
+    mins = np.fmin.reduceat(values, starts)
+    maxs = np.fmax.reduceat(values, starts)
+    return base + index[starts] * bucket, mins, maxs, means
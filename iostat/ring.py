@@ -0,0 +1,169 @@
+import numpy as np
+
+from .store import StatStore, to_timestamp
+
+
+class RingBuffer:
+    """
+    Fixed-capacity buffer of the latest (key, values) rows
+
+    Each row is written twice, at i and i + capacity, so the rows in order
+    are always one contiguous slice and reading them doesn't copy.
+
+    >>> ring = RingBuffer(3, 2)
+    >>> for i in range(5):
+    ...     ring.append(i, [i, i * 10])
+    >>> len(ring)
+    3
+    >>> keys, values = ring.view()
+    >>> keys.tolist(), values.tolist()
+    ([2.0, 3.0, 4.0], [[2.0, 20.0], [3.0, 30.0], [4.0, 40.0]])
+    """
+
+    def __init__(self, capacity, width):
+        self.capacity = capacity
+        self.width = width
+        self.keys = np.empty(capacity * 2)
+        self.values = np.empty((capacity * 2, width))
+        self.start = 0
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def append(self, key, values):
+        if self.size < self.capacity:
+            i = self.start + self.size
+            self.size += 1
+        else:
+            i = self.start
+            self.start = (self.start + 1) % self.capacity
+        i %= self.capacity
+        for j in (i, i + self.capacity):
+            self.keys[j] = key
+            self.values[j] = values
+
+    def view(self):
+        """
+        return (keys, values) from the oldest row
+        """
+        end = self.start + self.size
+        return self.keys[self.start:end], self.values[self.start:end]
+
+    def discard_before(self, key):
+        """
+        drop the rows older than the key
+
+        >>> ring = RingBuffer(3, 1)
+        >>> for i in range(3):
+        ...     ring.append(i, [i])
+        >>> ring.discard_before(1)
+        >>> ring.view()[0].tolist()
+        [1.0, 2.0]
+        """
+        keys, _ = self.view()
+        discarded = int(np.searchsorted(keys, key))
+        self.start = (self.start + discarded) % self.capacity
+        self.size -= discarded
+
+
+class History:
+    """
+    Recent snapshots kept in ring buffers for CPU and each disk
+
+    The history is bounded by the number of snapshots, and also by the
+    duration in seconds from the latest snapshot if it's given.
+
+    >>> from datetime import datetime
+    >>> history = History(10, duration=60)
+    >>> for minute in range(3):
+    ...     history.add({
+    ...         'date': datetime(2018, 6, 13, 14, minute, 0),
+    ...         'cpu': {'columns': ['%user'], 'stat': [1.0]},
+    ...         'device': {'columns': ['r/s'], 'stats': [{'sda': [2.0]}]},
+    ...     })
+    >>> store = history.to_store()
+    >>> [d.minute for d in store.datetimes().tolist()]
+    [1, 2]
+    >>> store.get_stat(1)['device']['stats']
+    [{'sda': [2.0]}]
+    """
+
+    def __init__(self, size, duration=None):
+        self.size = size
+        self.duration = duration
+        self.cpu_columns = None
+        self.device_columns = None
+        self.cpu = None
+        self.devices = {}
+
+    def add(self, stat):
+        key = to_timestamp(stat['date'])
+        cpu = stat['cpu']
+        if cpu['columns'] is not None and cpu['stat'] is not None:
+            if self.cpu is None:
+                self.cpu_columns = cpu['columns']
+                self.cpu = RingBuffer(self.size, len(self.cpu_columns))
+            self.cpu.append(key, cpu['stat'])
+
+        device = stat['device']
+        if device['columns'] is not None:
+            self.device_columns = device['columns']
+            for disk in device['stats']:
+                for name, values in disk.items():
+                    ring = self.devices.get(name)
+                    if ring is None:
+                        ring = RingBuffer(self.size, len(self.device_columns))
+                        self.devices[name] = ring
+                    ring.append(key, values)
+
+        if self.duration is not None:
+            for ring in self.iter_rings():
+                ring.discard_before(key - self.duration)
+
+    def iter_rings(self):
+        if self.cpu is not None:
+            yield self.cpu
+        yield from self.devices.values()
+
+    def get_keys(self):
+        """
+        return sorted timestamps of the snapshots in the history
+        """
+        keys = [ring.view()[0] for ring in self.iter_rings()]
+        if not keys:
+            return np.array([], dtype=np.int64)
+        return np.unique(np.concatenate(keys)).astype(np.int64)
+
+    def to_store(self):
+        """
+        copy the snapshots to a new store, e.g.) to export them
+        """
+        store = StatStore()
+        keys = self.get_keys()
+        store.dates.frombytes(keys.tobytes())
+
+        if self.cpu is not None:
+            store.cpu_columns = self.cpu_columns
+            ring_keys, values = self.cpu.view()
+            cpu = np.full((len(keys), len(self.cpu_columns)), np.nan)
+            cpu[np.searchsorted(keys, ring_keys)] = values
+            store.cpu.frombytes(cpu.tobytes())
+
+        if self.device_columns is not None:
+            store.device_columns = self.device_columns
+            rows, ids, values = [], [], []
+            for name, ring in self.devices.items():
+                ring_keys, ring_values = ring.view()
+                rows.append(np.searchsorted(keys, ring_keys))
+                ids.append(np.full(len(ring), store.get_device_id(name)))
+                values.append(ring_values)
+            if rows:
+                rows = np.concatenate(rows)
+                order = np.argsort(rows, kind='stable')
+                ids = np.concatenate(ids).astype(np.int32)
+                values = np.concatenate(values)
+                store.device_rows.frombytes(rows[order].tobytes())
+                store.device_ids.frombytes(ids[order].tobytes())
+                store.devices.frombytes(values[order].tobytes())
+        return store
@@ -0,0 +1,274 @@
+"""
+Rolling window aggregation of series in the store
+
+A window of each sample covers the samples in the given seconds up to it,
+the start of every window is found at once by binary search. Mean takes
+O(1) per sample from cumulative sums and max takes O(log w) from a sparse
+table of maxima over power-of-two spans. Median takes O(log w) from two
+heaps of the lower and the upper halves of the window, the samples leaving
+the window are removed lazily when they come to the top. NaN values are
+ignored.
+"""
+from heapq import heappop, heappush
+
+import numpy as np
+
+from .consts import ROLLING_MAX, ROLLING_MEAN, ROLLING_MEDIAN
+from .profiler import stage
+from .store import StatStore
+
+
+def get_window_starts(timestamps, window):
+    """
+    return index of the first sample in the window of each sample
+
+    >>> get_window_starts(np.array([0, 1, 2, 5, 6]), 3).tolist()
+    [0, 0, 0, 3, 3]
+    """
+    return np.searchsorted(timestamps, timestamps - window, side='right')
+
+
+def rolling_mean(values, starts):
+    """
+    >>> values = np.array([[1.0], [3.0], [np.nan], [8.0]])
+    >>> rolling_mean(values, np.array([0, 0, 1, 2])).ravel().tolist()
+    [1.0, 2.0, 3.0, 8.0]
+    """
+    valid = ~np.isnan(values)
+    zeros = np.zeros((1, values.shape[1]))
+    sums = np.concatenate([zeros, np.cumsum(np.where(valid, values, 0.0), 0)])
+    counts = np.concatenate([zeros, np.cumsum(valid, 0)])
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return (sums[1:] - sums[starts]) / (counts[1:] - counts[starts])
+
+
+def rolling_max(values, starts):
+    """
+    >>> values = np.array([[1.0], [5.0], [np.nan], [2.0], [3.0]])
+    >>> rolling_max(values, np.array([0, 0, 0, 1, 3])).ravel().tolist()
+    [1.0, 5.0, 5.0, 5.0, 3.0]
+    """
+    ends = np.arange(len(values))
+    levels = np.log2(ends - starts + 1).astype(np.int64)
+    result = np.empty_like(values)
+    # table[i] is the max of 2 ** level values from i
+    table = values
+    for level in range(int(levels.max(initial=0)) + 1):
+        if level > 0:
+            half = 1 << (level - 1)
+            table = np.fmax(table[:-half], table[half:])
+        selected = levels == level
+        result[selected] = np.fmax(
+            table[starts[selected]],
+            table[ends[selected] - (1 << level) + 1],
+        )
+    return result
+
+
+class SlidingMedian:
+    """
+    median of a window of values added and removed in any order
+
+    low is a max-heap of the lower half by negated values and high is a
+    min-heap of the upper half, low has one more value for an odd count.
+    Removed values are counted in delayed and popped when they come to
+    the top, so the tops are always in the window.
+
+    >>> window = SlidingMedian()
+    >>> for value in [5.0, 1.0, 3.0]:
+    ...     window.add(value)
+    >>> window.median()
+    3.0
+    >>> window.remove(3.0)
+    >>> window.median()
+    3.0
+    >>> window.remove(1.0)
+    >>> window.remove(5.0)
+    >>> window.median()
+    nan
+    """
+
+    def __init__(self):
+        self.low = []
+        self.high = []
+        self.low_size = 0
+        self.high_size = 0
+        self.delayed = {}
+
+    def prune(self, heap, sign):
+        while heap:
+            value = sign * heap[0]
+            count = self.delayed.get(value, 0)
+            if count == 0:
+                break
+            if count == 1:
+                del self.delayed[value]
+            else:
+                self.delayed[value] = count - 1
+            heappop(heap)
+
+    def balance(self):
+        if self.low_size > self.high_size + 1:
+            heappush(self.high, -heappop(self.low))
+            self.low_size -= 1
+            self.high_size += 1
+            self.prune(self.low, -1)
+        elif self.low_size < self.high_size:
+            heappush(self.low, -heappop(self.high))
+            self.low_size += 1
+            self.high_size -= 1
+            self.prune(self.high, 1)
+
+    def add(self, value):
+        if not self.low or value <= -self.low[0]:
+            heappush(self.low, -value)
+            self.low_size += 1
+        else:
+            heappush(self.high, value)
+            self.high_size += 1
+        self.balance()
+
+    def remove(self, value):
+        """
+        remove a value in the window
+        """
+        self.delayed[value] = self.delayed.get(value, 0) + 1
+        if value <= -self.low[0]:
+            self.low_size -= 1
+            if value == -self.low[0]:
+                self.prune(self.low, -1)
+        else:
+            self.high_size -= 1
+            if value == self.high[0]:
+                self.prune(self.high, 1)
+        self.balance()
+
+    def median(self):
+        if self.low_size == 0:
+            return np.nan
+        if self.low_size > self.high_size:
+            return -self.low[0]
+        return (-self.low[0] + self.high[0]) / 2
+
+
+def rolling_median(values, starts):
+    """
+    >>> values = np.array([[1.0], [5.0], [2.0], [np.nan], [9.0]])
+    >>> rolling_median(values, np.array([0, 0, 0, 1, 2])).ravel().tolist()
+    [1.0, 3.0, 2.0, 3.5, 5.5]
+
+    it's the same as the median of each window on irregular timestamps
+
+    >>> import warnings
+    >>> rng = np.random.default_rng(1)
+    >>> timestamps = np.cumsum(rng.integers(1, 5, 300))
+    >>> values = rng.random((300, 3))
+    >>> values[rng.random((300, 3)) < 0.3] = np.nan
+    >>> starts = get_window_starts(timestamps, 20)
+    >>> with warnings.catch_warnings():
+    ...     warnings.simplefilter('ignore')  # all NaN windows
+    ...     naive = np.array([np.nanmedian(values[start:end + 1], axis=0)
+    ...                       for end, start in enumerate(starts)])
+    >>> np.allclose(rolling_median(values, starts), naive, equal_nan=True)
+    True
+    """
+    starts = starts.tolist()
+    result = np.empty_like(values)
+    for j in range(values.shape[1]):
+        column = values[:, j].tolist()
+        medians = []
+        window = SlidingMedian()
+        first = 0
+        for value, start in zip(column, starts):
+            # NaN is not equal to itself
+            if value == value:
+                window.add(value)
+            while first < start:
+                value = column[first]
+                if value == value:
+                    window.remove(value)
+                first += 1
+            medians.append(window.median())
+        result[:, j] = medians
+    return result
+
+
+ROLLING_FUNCTIONS = {
+    ROLLING_MEAN: rolling_mean,
+    ROLLING_MEDIAN: rolling_median,
+    ROLLING_MAX: rolling_max,
+}
+
+
+def rolling(timestamps, values, window, func):
+    """
+    return values aggregated by func in the window of seconds for each
+    column of values, the timestamps must be in order
+
+    >>> t = np.array([0, 1, 2, 10])
+    >>> v = np.array([[1.0, 10.0], [2.0, 20.0], [3.0, 30.0], [4.0, 40.0]])
+    >>> rolling(t, v, 2, 'mean').tolist()
+    [[1.0, 10.0], [1.5, 15.0], [2.5, 25.0], [4.0, 40.0]]
+    """
+    if len(values) == 0:
+        return values
+    starts = get_window_starts(timestamps, window)
+    return ROLLING_FUNCTIONS[func](values, starts)
+
+
+def rolling_store(store, window, func):
+    """
+    return a new store with all series aggregated in the rolling window
+
+    >>> from datetime import datetime
+    >>> store = StatStore()
+    >>> store.set_device_columns(['r/s'])
+    >>> for sec in range(3):
+    ...     _ = store.add_date(datetime(2018, 6, 13, 14, 10, sec))
+    ...     store.add_device('sda', [float(sec)])
+    ...     store.add_device('sdb', [10.0 * sec])
+    >>> rolled = rolling_store(store, 2, 'max')
+    >>> rolled.device_matrix('sda')[1].ravel().tolist()
+    [0.0, 1.0, 2.0]
+    >>> rolled.device_matrix('sdb')[1].ravel().tolist()
+    [0.0, 10.0, 20.0]
+    """
+    store = store.sort()
+    timestamps = store.timestamps()
+    rolled = StatStore()
+    rolled.cpu_columns = store.cpu_columns
+    rolled.device_columns = store.device_columns
+    rolled.dates.frombytes(timestamps.tobytes())
+
+    if store.has_cpu and len(store.cpu) > 0:
+        cpu = store.cpu_matrix().copy()
+        # snapshots without cpu stat stay empty
+        rows = np.flatnonzero(~np.isnan(cpu).all(axis=1))
+        cpu[rows] = rolling(timestamps[rows], cpu[rows], window, func)
+        rolled.cpu.frombytes(cpu.tobytes())
+
+    if store.has_device and len(store.device_rows) > 0:
+        for name in store.device_names:
+            rolled.get_device_id(name)
+        rows, ids, values = store.device_table()
+        # roll the entries of each disk, they are in order of snapshots
+        order = np.argsort(ids, kind='stable')
+        grouped = values[order]
+        times = timestamps[rows[order]]
+        _, starts = np.unique(ids[order], return_index=True)
+        for first, last in zip(starts, np.append(starts[1:], len(order))):
+            grouped[first:last] = rolling(
+                times[first:last], grouped[first:last], window, func)
+        devices = np.empty_like(values)
+        devices[order] = grouped
+        rolled.device_rows.frombytes(rows.tobytes())
+        rolled.device_ids.frombytes(ids.tobytes())
+        rolled.devices.frombytes(devices.tobytes())
+    return rolled
+
+
+def apply_rolling(args, store):
+    if args.rolling is None:
+        return store
+    with stage('rolling'):
+        return rolling_store(store, args.rolling, args.rolling_func)
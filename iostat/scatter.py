@@ -1,19 +1,38 @@
-from datetime import datetime, timedelta
+import time
+from datetime import timedelta
 
 import matplotlib.pyplot as plt
+import numpy as np
+from matplotlib import dates as mdates
 from matplotlib import gridspec
 
 from .renderer import Renderer
 
+# margin to the right end of x-axis, it also avoids full redraw every time
+X_MARGIN = timedelta(seconds=2) / timedelta(days=1)
+X_MARGIN_RATIO = 0.25
+Y_MARGIN_RATIO = 0.05
+Y_LIVE_MARGIN_RATIO = 0.5
+
 
 class Scatter(Renderer):
+    """
+    Scatter stats of the latest snapshots
+
+    There is one artist for each subplot and disk, and each of them are
+    updated in place from ring buffers in the history. Histories of several
+    sources, e.g.) hosts, are scattered in the same figure. In live mode, the
+    figure is redrawn at most once in the redraw interval and only the
+    artists are drawn on the saved background unless the axes limits are
+    changed.
+    """
 
-    def __init__(self, args):
+    def __init__(self, args, histories, live=False):
         self.args = args
         self.closed = False
+        self.histories = histories
+        self.live = live
         self.start_date = args.since
-        if self.start_date is None:
-            self.start_date = datetime.now()
 
         figsize = args.figsize
         if figsize is None:
@@ -22,10 +41,21 @@ class Scatter(Renderer):
         self.fig = plt.figure(figsize=figsize)
         self.fig.suptitle('iostat scatter')
         self.fig.canvas.mpl_connect('close_event', self.close_handler)
+        if self.live:
+            self.fig.canvas.mpl_connect('draw_event', self.draw_handler)
 
         self.row_length = 5
         self.init_cpu()
         self.init_device()
+        plt.subplots_adjust(wspace=0.4, hspace=0.4)
+
+        self.cpu_lines = {}
+        self.device_lines = {}
+        self.background = None
+        self.shown = False
+        self.drawn_at = 0
+        # snapshots are added after the last redraw
+        self.dirty = False
 
     def close_handler(self, event):
         # FIXME: how to exit forcely
@@ -33,6 +63,11 @@ class Scatter(Renderer):
         plt.close(self.fig)
         raise SystemExit
 
+    def draw_handler(self, event):
+        # a full draw, e.g.) by resizing, invalidates the background
+        self.background = self.fig.canvas.copy_from_bbox(self.fig.bbox)
+        self.draw_lines()
+
     def init_cpu(self):
         self.cpus = []
         items = ['%user', '%nice', '%system', '%iowait', '%steal', '%idle']
@@ -40,6 +75,8 @@ class Scatter(Renderer):
             subplot = self.fig.add_subplot(self.row_length, 6, i)
             subplot.set_title(item)
             subplot.set_ylabel('percent')
+            subplot.set_ylim(0, 100)
+            subplot.xaxis_date()
             self.cpus.append(subplot)
 
     def init_device(self):
@@ -63,35 +100,167 @@ class Scatter(Renderer):
         subplot.set_title('%util')
         self.devices.append(subplot)
 
-    def scatter_cpu(self, date, stat):
-        if stat['columns'] is None:
-            return
+        for subplot in self.devices:
+            subplot.xaxis_date()
 
-        end_date = date + timedelta(seconds=2)
-        for i, column in enumerate(stat['columns']):
-            self.cpus[i].scatter(date, stat['stat'][i])
-            self.cpus[i].axis([self.start_date, end_date, 0, 100])
+    def make_lines(self, subplots, width):
+        lines = []
+        for subplot in subplots[:width]:
+            line, = subplot.plot(
+                [], [], marker='o', linestyle='', animated=self.live)
+            lines.append(line)
+        return lines
 
-    def scatter_device(self, date, device):
-        if device['columns'] is None:
-            return
+    def add_lines(self, tag):
+        """
+        make artists for CPU and disks which appear in the history
+        """
+        history = self.histories[tag]
+        if history.cpu is not None and tag not in self.cpu_lines:
+            width = len(history.cpu_columns)
+            self.cpu_lines[tag] = self.make_lines(self.cpus, width)
+
+        for disk_name in history.devices:
+            if (tag, disk_name) not in self.device_lines:
+                width = len(history.device_columns)
+                self.device_lines[tag, disk_name] = self.make_lines(
+                    self.devices, width)
+
+    def iter_lines(self):
+        """
+        yield (subplot, line, ring buffer, column index) of all artists
+        """
+        for tag, lines in self.cpu_lines.items():
+            ring = self.histories[tag].cpu
+            for i, line in enumerate(lines):
+                yield self.cpus[i], line, ring, i
+        for (tag, disk_name), lines in self.device_lines.items():
+            ring = self.histories[tag].devices[disk_name]
+            for i, line in enumerate(lines):
+                yield self.devices[i], line, ring, i
+
+    def update_lines(self):
+        x = {}
+        for _, line, ring, i in self.iter_lines():
+            keys, values = ring.view()
+            if ring not in x:
+                x[ring] = mdates.date2num(keys.astype('datetime64[s]'))
+            line.set_data(x[ring], values[:, i])
+
+    def draw_lines(self):
+        for _, line, _, _ in self.iter_lines():
+            self.fig.draw_artist(line)
+
+    def get_x_range(self):
+        keys = [ring.view()[0] for history in self.histories.values()
+                for ring in history.iter_rings()]
+        keys = [k for k in keys if len(k) > 0]
+        if not keys:
+            return None
+        x_range = [min(k[0] for k in keys), max(k[-1] for k in keys)]
+        return mdates.date2num(
+            np.array(x_range, dtype=np.int64).astype('datetime64[s]'))
 
-        end_date = date + timedelta(seconds=2)
-        for i, column in enumerate(device['columns']):
-            for disk in device['stats']:
-                for disk_name, disk_stat in disk.items():
-                    self.devices[i].set_xlim(self.start_date, end_date)
-                    self.devices[i].scatter(date, disk_stat[i])
+    def get_y_max(self):
+        y_max = {}
+        for subplot, _, ring, i in self.iter_lines():
+            if subplot in self.cpus or not ring:
+                continue
+            top = ring.view()[1][:, i].max()
+            y_max[subplot] = max(y_max.get(subplot, top), top)
+        return y_max
 
-    def scatter(self, stat):
+    def update_limits(self, fit=False):
+        """
+        update the axes limits if the stats are out of them,
+        return True when they are changed
+        """
+        x_range = self.get_x_range()
+        if x_range is None:
+            return False
+
+        x_min, x_max = x_range
+        if self.start_date is not None:
+            x_min = min(x_min, mdates.date2num(self.start_date))
+        left, right = self.devices[0].get_xlim()
+        y_max = self.get_y_max()
+        changed = fit or x_max > right or any(
+            top > subplot.get_ylim()[1] for subplot, top in y_max.items())
+        if not changed:
+            return False
+
+        margin = X_MARGIN
+        y_margin_ratio = Y_MARGIN_RATIO
+        if not fit:
+            margin = max(margin, (x_max - x_min) * X_MARGIN_RATIO)
+            y_margin_ratio = Y_LIVE_MARGIN_RATIO
+        for subplot in self.cpus + self.devices:
+            subplot.set_xlim(x_min, x_max + margin)
+        for subplot, top in y_max.items():
+            subplot.set_ylim(0, top * (1 + y_margin_ratio) or 1)
+        return True
+
+    def redraw(self):
+        # the interval is from the start of drawing not to count its time
+        self.drawn_at = time.monotonic()
+        self.dirty = False
+        self.update_lines()
+        canvas = self.fig.canvas
+        if not self.shown:
+            self.update_limits()
+            # show the figure and draw it at first
+            plt.pause(0.001)
+            self.shown = True
+        elif self.update_limits() or self.background is None:
+            # draw_handler saves the background and draws the artists
+            canvas.draw()
+        else:
+            canvas.restore_region(self.background)
+            self.draw_lines()
+            canvas.blit(self.fig.bbox)
+        canvas.flush_events()
+
+    def get_redraw_timeout(self):
+        """
+        return seconds to wait for the next redraw of pending snapshots,
+        or the redraw interval when nothing is pending
+        """
+        if not self.dirty:
+            return self.args.redraw_interval
+        elapsed = time.monotonic() - self.drawn_at
+        return max(self.args.redraw_interval - elapsed, 0)
+
+    def redraw_pending(self):
+        """
+        redraw snapshots skipped in the redraw interval, e.g.) when no
+        output comes after them
+        """
+        if self.dirty:
+            self.redraw()
+        else:
+            self.fig.canvas.flush_events()
+
+    def scatter(self, stat, tag=None):
         if self.closed:
             return
 
-        date = stat['date']
-        self.scatter_cpu(date, stat['cpu'])
-        self.scatter_device(date, stat['device'])
-        plt.pause(0.001)
-        plt.subplots_adjust(wspace=0.4, hspace=0.4)
+        self.histories[tag].add(stat)
+        self.add_lines(tag)
+        if not self.live:
+            return
+        self.dirty = True
+        if time.monotonic() - self.drawn_at >= self.args.redraw_interval:
+            self.redraw()
+
+    def finish(self):
+        """
+        draw all artists on the figure as usual
+        """
+        self.update_lines()
+        for _, line, _, _ in self.iter_lines():
+            line.set_animated(False)
+        self.update_limits(fit=True)
+        self.set_vlines()
 
     def set_vlines(self):
         if not hasattr(self.args, 'vlines'):
@@ -104,9 +273,9 @@ class Scatter(Renderer):
                 dev.axvline(vline, linestyle=':', linewidth=3, color='purple')
 
     def show(self):
-        self.set_vlines()
+        self.finish()
         plt.show(block=True)
 
     def save(self):
-        self.set_vlines()
+        self.finish()
         plt.savefig(self.output)
@@ -0,0 +1,488 @@
+import copy
+from array import array
+from datetime import datetime, timedelta
+
+import numpy as np
+
+EPOCH = datetime(1970, 1, 1)
+
+
+def to_timestamp(date):
+    """
+    >>> to_timestamp(datetime(2018, 6, 13, 14, 10, 50))
+    1528899050
+    """
+    return int((date - EPOCH).total_seconds())
+
+
+def from_timestamp(timestamp):
+    """
+    >>> from_timestamp(1528899050)
+    datetime.datetime(2018, 6, 13, 14, 10, 50)
+    """
+    return EPOCH + timedelta(seconds=int(timestamp))
+
+
+def reindex_columns(values, columns, new_columns):
+    """
+    return values in order of new_columns, the columns which are not in
+    columns are NaN
+
+    >>> values = np.array([[1.0, 2.0]])
+    >>> reindex_columns(values, ['r/s', 'w/s'], ['w/s', 'await']).tolist()
+    [[2.0, nan]]
+    """
+    if columns == new_columns:
+        return values
+    result = np.full((len(values), len(new_columns)), np.nan)
+    for i, column in enumerate(new_columns):
+        if column in columns:
+            result[:, i] = values[:, columns.index(column)]
+    return result
+
+
+class StatStore:
+    """
+    Columnar storage of parsed iostat snapshots
+
+    Timestamps are kept as seconds since the epoch (the naive iostat time
+    is treated as UTC), CPU stats as one row per snapshot and device stats
+    as one long table of (snapshot row, device id, values) entries.
+
+    Read methods return NumPy views on the underlying buffers without
+    copying, so the views must be released before appending again.
+
+    >>> store = StatStore()
+    >>> store.set_cpu_columns(['%user', '%idle'])
+    >>> store.set_device_columns(['r/s', 'w/s'])
+    >>> store.add_date(datetime(2018, 6, 13, 14, 10, 50))
+    0
+    >>> store.add_cpu([0.5, 99.5])
+    >>> store.add_device('sda', [1.0, 2.0])
+    >>> store.add_device('sdb', [3.0, 4.0])
+    >>> store.add_date(datetime(2018, 6, 13, 14, 10, 51))
+    1
+    >>> store.add_device('sdb', [5.0, 6.0])
+    >>> len(store), store.device_names
+    (2, ['sda', 'sdb'])
+    >>> store.cpu_matrix()
+    array([[ 0.5, 99.5],
+           [ nan,  nan]])
+    >>> rows, values = store.device_matrix('sdb')
+    >>> rows.tolist(), values.tolist()
+    ([0, 1], [[3.0, 4.0], [5.0, 6.0]])
+    >>> [(name, rows.tolist()) for name, rows, _ in store.iter_devices()]
+    [('sda', [0]), ('sdb', [0, 1])]
+    >>> store.get_stat(1)['device']['stats']
+    [{'sdb': [5.0, 6.0]}]
+
+    A store can keep only a part of the stats, this one drops CPU stats
+    and keeps the w/s column of devices.
+
+    >>> store = StatStore(keep_cpu=False, keep_device_columns=['w/s'])
+    >>> store.set_cpu_columns(['%user', '%idle'])
+    >>> store.set_device_columns(['r/s', 'w/s'])
+    >>> store.add_date(datetime(2018, 6, 13, 14, 10, 50))
+    0
+    >>> store.add_cpu([0.5, 99.5])
+    >>> store.add_device('sda', [1.0, 2.0])
+    >>> store.has_cpu, store.device_columns, store.device_table()[2]
+    (False, ['w/s'], array([[2.]]))
+    """
+
+    def __init__(self, keep_cpu=True, keep_device_columns=None):
+        self.keep_cpu = keep_cpu
+        self.keep_device_columns = keep_device_columns
+        self._device_index = None
+
+        self.cpu_columns = None
+        self.device_columns = None
+        self.device_names = []
+        self._device_ids = {}
+
+        self.dates = array('q')
+        self.cpu = array('d')
+        self.device_rows = array('q')
+        self.device_ids = array('i')
+        self.devices = array('d')
+
+    def __len__(self):
+        return len(self.dates)
+
+    @property
+    def nbytes(self):
+        arrays = [
+            self.dates, self.cpu,
+            self.device_rows, self.device_ids, self.devices,
+        ]
+        return sum(a.itemsize * len(a) for a in arrays)
+
+    @property
+    def projected(self):
+        return not self.keep_cpu or self.keep_device_columns is not None
+
+    def clear(self):
+        """
+        drop all snapshots but keep the columns and the device ids,
+        e.g.) to parse a huge output in batches
+
+        >>> store = StatStore()
+        >>> store.set_device_columns(['r/s'])
+        >>> store.add_date(datetime(2018, 6, 13, 14, 10, 50))
+        0
+        >>> store.add_device('sda', [1.0])
+        >>> store.clear()
+        >>> len(store), store.device_names, store.device_table()[2].shape
+        (0, ['sda'], (0, 1))
+        """
+        # new buffers not to resize the ones still exported to views
+        self.dates = array('q')
+        self.cpu = array('d')
+        self.device_rows = array('q')
+        self.device_ids = array('i')
+        self.devices = array('d')
+
+    def set_cpu_columns(self, columns):
+        if self.cpu_columns is None and self.keep_cpu:
+            self.cpu_columns = columns
+
+    def set_device_columns(self, columns):
+        if self.device_columns is not None or columns is None:
+            return
+        if self.keep_device_columns is None:
+            self.device_columns = columns
+            return
+
+        index = [i for i, column in enumerate(columns)
+                 if column in self.keep_device_columns]
+        if index:
+            self._device_index = index
+            self.device_columns = [columns[i] for i in index]
+
+    def add_date(self, date):
+        self.dates.append(to_timestamp(date))
+        return len(self.dates) - 1
+
+    def pad_cpu(self, rows):
+        """
+        fill snapshots without cpu stat up to the given rows with NaN
+        """
+        width = len(self.cpu_columns)
+        missing = rows - len(self.cpu) // width
+        if missing > 0:
+            self.cpu.extend([np.nan] * (missing * width))
+
+    def add_cpu(self, values):
+        if self.cpu_columns is None:
+            return
+        self.pad_cpu(len(self.dates) - 1)
+        self.cpu.extend(values)
+
+    def get_device_id(self, name):
+        device_id = self._device_ids.get(name)
+        if device_id is None:
+            device_id = len(self.device_names)
+            self._device_ids[name] = device_id
+            self.device_names.append(name)
+        return device_id
+
+    def add_device(self, name, values):
+        if self.device_columns is None:
+            return
+        if self._device_index is not None:
+            values = [values[i] for i in self._device_index]
+        self.device_rows.append(len(self.dates) - 1)
+        self.device_ids.append(self.get_device_id(name))
+        self.devices.extend(values)
+
+    def add_devices(self, names, values):
+        """
+        add stats of several devices in the last snapshot at once
+        """
+        if self.device_columns is None:
+            return
+        if self._device_index is not None:
+            values = values[:, self._device_index]
+        self.device_rows.extend([len(self.dates) - 1] * len(names))
+        self.device_ids.extend([self.get_device_id(i) for i in names])
+        self.devices.frombytes(np.ascontiguousarray(values).tobytes())
+
+    def add_cpu_columns(self, columns):
+        """
+        add the columns not in the store, their values are NaN
+        """
+        if not self.keep_cpu:
+            return
+        added = [i for i in columns if i not in self.cpu_columns]
+        if not added:
+            return
+        merged = self.cpu_columns + added
+        cpu = reindex_columns(self.cpu_matrix(), self.cpu_columns, merged)
+        self.cpu = array('d', cpu.tobytes())
+        self.cpu_columns = merged
+
+    def add_device_columns(self, columns):
+        """
+        add the columns not in the store, their values are NaN, only the
+        kept columns are added to a projected store
+        """
+        added = [i for i in columns if i not in self.device_columns]
+        if self.keep_device_columns is not None:
+            added = [i for i in added if i in self.keep_device_columns]
+        if not added:
+            return
+        merged = self.device_columns + added
+        values = reindex_columns(
+            self.device_table()[2], self.device_columns, merged)
+        self.devices = array('d', values.tobytes())
+        self.device_columns = merged
+
+    def extend(self, other):
+        """
+        append all snapshots in other store, the columns of both stores
+        are merged when they differ, e.g.) outputs of different sysstat
+        versions, and the missing values are NaN
+
+        >>> a, b = StatStore(), StatStore()
+        >>> for store, name in [(a, 'sda'), (b, 'sdb')]:
+        ...     store.set_device_columns(['r/s'])
+        ...     _ = store.add_date(datetime(2018, 6, 13, 14, 10, 50))
+        ...     store.add_device(name, [1.0])
+        >>> a.extend(b)
+        >>> [(name, rows.tolist()) for name, rows, _ in a.iter_devices()]
+        [('sda', [0]), ('sdb', [1])]
+        >>> c = StatStore()
+        >>> c.set_device_columns(['w/s', 'r/s'])
+        >>> _ = c.add_date(datetime(2018, 6, 13, 14, 10, 51))
+        >>> c.add_device('sda', [2.0, 3.0])
+        >>> a.extend(c)
+        >>> a.device_columns, a.device_table()[2].tolist()
+        (['r/s', 'w/s'], [[1.0, nan], [1.0, nan], [3.0, 2.0]])
+        """
+        offset = len(self.dates)
+        self.set_cpu_columns(other.cpu_columns)
+        self.set_device_columns(other.device_columns)
+
+        if self.has_cpu and other.has_cpu and len(other.cpu) > 0:
+            self.add_cpu_columns(other.cpu_columns)
+            self.pad_cpu(offset)
+            cpu = np.frombuffer(other.cpu, dtype=np.float64).reshape(
+                -1, len(other.cpu_columns))
+            cpu = reindex_columns(cpu, other.cpu_columns, self.cpu_columns)
+            self.cpu.frombytes(cpu.tobytes())
+        self.dates.frombytes(other.timestamps().tobytes())
+
+        if self.has_device and other.has_device and len(other.device_rows):
+            self.add_device_columns(other.device_columns)
+            rows, ids, values = other.device_table()
+            values = reindex_columns(
+                values, other.device_columns, self.device_columns)
+            id_map = np.array(
+                [self.get_device_id(i) for i in other.device_names],
+                dtype=np.int32,
+            )
+            self.device_rows.frombytes((rows + offset).tobytes())
+            self.device_ids.frombytes(id_map[ids].tobytes())
+            self.devices.frombytes(np.ascontiguousarray(values).tobytes())
+
+    def select(self, since=None, until=None, disks=None):
+        """
+        return a new store with snapshots between since and until
+        and stats of the disks only
+
+        >>> store = StatStore()
+        >>> store.set_device_columns(['r/s'])
+        >>> for sec in range(3):
+        ...     _ = store.add_date(datetime(2018, 6, 13, 14, 10, sec))
+        ...     store.add_device('sda', [1.0])
+        ...     store.add_device('sdb', [2.0])
+        >>> selected = store.select(
+        ...     since=datetime(2018, 6, 13, 14, 10, 1), disks=['sdb'])
+        >>> len(selected), selected.device_names
+        (2, ['sdb'])
+        >>> selected.device_table()[0].tolist()
+        [0, 1]
+        """
+        if since is None and until is None and not disks:
+            return self
+
+        timestamps = self.timestamps()
+        selected = np.ones(len(timestamps), dtype=bool)
+        if since is not None:
+            selected &= timestamps >= to_timestamp(since)
+        if until is not None:
+            selected &= timestamps <= to_timestamp(until)
+        new_rows = np.cumsum(selected, dtype=np.int64) - 1
+
+        store = StatStore()
+        store.cpu_columns = self.cpu_columns
+        store.device_columns = self.device_columns
+        store.dates.frombytes(timestamps[selected].tobytes())
+        if self.has_cpu and len(self.cpu) > 0:
+            cpu = self.cpu_matrix()[selected]
+            store.cpu.frombytes(np.ascontiguousarray(cpu).tobytes())
+
+        if self.has_device and len(self.device_rows) > 0:
+            rows, ids, values = self.device_table()
+            mask = selected[rows]
+            if disks:
+                disk_ids = [i for i, name in enumerate(self.device_names)
+                            if name in disks]
+                mask &= np.isin(ids, disk_ids)
+            ids = ids[mask]
+            # keep device names in order of their first appearance
+            unique_ids, first = np.unique(ids, return_index=True)
+            id_map = np.zeros(len(self.device_names), dtype=np.int32)
+            for device_id in unique_ids[np.argsort(first)]:
+                name = self.device_names[device_id]
+                id_map[device_id] = store.get_device_id(name)
+            store.device_rows.frombytes(new_rows[rows[mask]].tobytes())
+            store.device_ids.frombytes(id_map[ids].tobytes())
+            store.devices.frombytes(
+                np.ascontiguousarray(values[mask]).tobytes())
+        return store
+
+    def sort(self):
+        """
+        return a store with snapshots in order of timestamps
+
+        >>> store = StatStore()
+        >>> store.set_device_columns(['r/s'])
+        >>> for sec in [2, 0, 1]:
+        ...     _ = store.add_date(datetime(2018, 6, 13, 14, 10, sec))
+        ...     store.add_device('sda', [float(sec)])
+        >>> sorted_store = store.sort()
+        >>> [d.second for d in sorted_store.datetimes().tolist()]
+        [0, 1, 2]
+        >>> sorted_store.device_matrix('sda')[1].tolist()
+        [[0.0], [1.0], [2.0]]
+        """
+        timestamps = self.timestamps()
+        if np.all(timestamps[1:] >= timestamps[:-1]):
+            return self
+
+        order = np.argsort(timestamps, kind='stable')
+        new_rows = np.empty_like(order)
+        new_rows[order] = np.arange(len(order))
+
+        store = StatStore()
+        store.cpu_columns = self.cpu_columns
+        store.device_columns = self.device_columns
+        store.dates.frombytes(timestamps[order].tobytes())
+        if self.has_cpu and len(self.cpu) > 0:
+            cpu = self.cpu_matrix()[order]
+            store.cpu.frombytes(np.ascontiguousarray(cpu).tobytes())
+
+        if self.has_device and len(self.device_rows) > 0:
+            for name in self.device_names:
+                store.get_device_id(name)
+            rows, ids, values = self.device_table()
+            rows = new_rows[rows]
+            entries = np.argsort(rows, kind='stable')
+            store.device_rows.frombytes(rows[entries].tobytes())
+            store.device_ids.frombytes(ids[entries].tobytes())
+            store.devices.frombytes(
+                np.ascontiguousarray(values[entries]).tobytes())
+        return store
+
+    def shift(self, seconds):
+        """
+        return a store with timestamps moved by the seconds, the stats are
+        shared with this store
+
+        >>> store = StatStore()
+        >>> store.add_date(datetime(2018, 6, 13, 14, 10, 50))
+        0
+        >>> store.shift(-store.timestamps()[0]).get_date(0)
+        datetime.datetime(1970, 1, 1, 0, 0)
+        """
+        store = copy.copy(self)
+        store.dates = array('q')
+        store.dates.frombytes((self.timestamps() + seconds).tobytes())
+        return store
+
+    def get_date(self, row):
+        return from_timestamp(self.dates[row])
+
+    def datetimes(self):
+        return self.timestamps().astype('datetime64[s]')
+
+    def timestamps(self):
+        return np.frombuffer(self.dates, dtype=np.int64)
+
+    @property
+    def has_cpu(self):
+        return self.cpu_columns is not None
+
+    @property
+    def has_device(self):
+        return self.device_columns is not None
+
+    def cpu_matrix(self):
+        if not self.has_cpu:
+            return None
+        width = len(self.cpu_columns)
+        cpu = np.frombuffer(self.cpu, dtype=np.float64).reshape(-1, width)
+        missing = len(self.dates) - cpu.shape[0]
+        if missing > 0:
+            padding = np.full((missing, width), np.nan)
+            cpu = np.concatenate([cpu, padding])
+        return cpu
+
+    def device_table(self):
+        """
+        return (snapshot rows, device ids, values) of all device entries
+        """
+        width = len(self.device_columns)
+        rows = np.frombuffer(self.device_rows, dtype=np.int64)
+        ids = np.frombuffer(self.device_ids, dtype=np.int32)
+        values = np.frombuffer(self.devices, dtype=np.float64)
+        return rows, ids, values.reshape(-1, width)
+
+    def device_matrix(self, name):
+        """
+        return (snapshot rows, values) of the device
+        """
+        rows, ids, values = self.device_table()
+        mask = ids == self._device_ids[name]
+        return rows[mask], values[mask]
+
+    def iter_devices(self):
+        """
+        yield (name, snapshot rows, values) for each device
+        """
+        rows, ids, values = self.device_table()
+        order = np.argsort(ids, kind='stable')
+        counts = np.bincount(ids, minlength=len(self.device_names))
+        start = 0
+        for name, count in zip(self.device_names, counts):
+            index = order[start:start + count]
+            yield name, rows[index], values[index]
+            start += count
+
+    def get_stat(self, row):
+        """
+        return a snapshot with the dict layout of older versions
+        """
+        cpu_stat = {'columns': self.cpu_columns, 'stat': None}
+        cpu = self.cpu_matrix()
+        if cpu is not None and not np.isnan(cpu[row]).all():
+            cpu_stat['stat'] = cpu[row].tolist()
+
+        device_stat = {'columns': self.device_columns, 'stats': []}
+        if self.has_device:
+            rows, ids, values = self.device_table()
+            start, end = np.searchsorted(rows, [row, row + 1])
+            for i in range(start, end):
+                name = self.device_names[ids[i]]
+                device_stat['stats'].append({name: values[i].tolist()})
+
+        return {
+            'date': self.get_date(row),
+            'cpu': cpu_stat,
+            'device': device_stat,
+        }
+
+    def iter_stats(self):
+        for row in range(len(self)):
+            yield self.get_stat(row)
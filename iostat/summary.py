@@ -0,0 +1,259 @@
+"""
+Summarize device stats in a single streaming pass
+
+Snapshots are parsed in batches and each batch is folded into accumulators
+of every disk and column, so memory usage doesn't grow with the length of
+the output. Mean and stddev are merged with Welford's method, and the
+percentiles come from a histogram of log-scaled buckets whose relative
+error is within RELATIVE_ERROR.
+"""
+import json
+import math
+
+import numpy as np
+
+from .consts import AVGQU_SZ, AWAIT, IOPS, IO_TRANSFER, PERCENT_UTIL
+from .consts import DEVICE_SUBPLOT_COLUMNS, SUMMARY_FORMAT_JSON
+from .files import get_file_args
+from .parser import Parser
+from .profiler import stage
+from .store import StatStore
+from .utils import get_logger
+
+log = get_logger()
+
+# number of snapshots parsed before they are folded into the summary
+BATCH_ROWS = 4096
+
+SUMMARY_SUBPLOTS = [IOPS, IO_TRANSFER, PERCENT_UTIL, AVGQU_SZ, AWAIT]
+PERCENTILES = [50, 95, 99]
+
+# iostat prints 2 decimal places, smaller values are counted as zero
+RELATIVE_ERROR = 0.01
+MIN_VALUE = 0.01
+MAX_VALUE = 1e9
+GAMMA = (1 + RELATIVE_ERROR) / (1 - RELATIVE_ERROR)
+BUCKETS = math.ceil(math.log(MAX_VALUE / MIN_VALUE, GAMMA)) + 2
+
+
+def get_summary_columns():
+    columns = []
+    for name in SUMMARY_SUBPLOTS:
+        columns.extend(i for i in DEVICE_SUBPLOT_COLUMNS[name]
+                       if i not in columns)
+    return columns
+
+
+def get_bucket_index(values):
+    """
+    return the histogram bucket of each value, 0 is for values less than
+    MIN_VALUE and bucket i covers (MIN_VALUE * GAMMA ** (i - 2),
+    MIN_VALUE * GAMMA ** (i - 1)]
+
+    >>> get_bucket_index(np.array([0.0, 0.01, 0.0101, 1e12])).tolist()
+    [0, 1, 2, 1268]
+    """
+    index = np.zeros(len(values), dtype=np.int64)
+    positive = values >= MIN_VALUE
+    logs = np.log(values[positive] / MIN_VALUE) / math.log(GAMMA)
+    # round off the error of log to keep exact powers in their bucket
+    index[positive] = np.ceil(np.round(logs, 9)).astype(np.int64) + 1
+    return np.minimum(index, BUCKETS - 1)
+
+
+def get_bucket_value(index):
+    """
+    return the value with the least relative error in the bucket
+
+    >>> get_bucket_value(0), round(get_bucket_value(1), 4)
+    (0.0, 0.0099)
+    """
+    if index == 0:
+        return 0.0
+    upper = MIN_VALUE * GAMMA ** (index - 1)
+    return 2 * upper / (GAMMA + 1)
+
+
+class SeriesSummary:
+    """
+    Accumulator of a series, it takes values in batches
+
+    >>> series = SeriesSummary()
+    >>> series.add(np.arange(1.0, 51.0))
+    >>> series.add(np.arange(51.0, 101.0))
+    >>> series.count, series.min, series.mean, series.max
+    (100, 1.0, 50.5, 100.0)
+    >>> round(series.stddev, 4) == round(float(np.arange(1, 101).std()), 4)
+    True
+    >>> [abs(series.percentile(q) - q) <= q * RELATIVE_ERROR
+    ...  for q in PERCENTILES]
+    [True, True, True]
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self.buckets = np.zeros(BUCKETS, dtype=np.int64)
+
+    def add(self, values):
+        values = values[~np.isnan(values)]
+        count = len(values)
+        if count == 0:
+            return
+        mean = float(values.mean())
+        m2 = float(np.square(values - mean).sum())
+
+        # merge moments of the batch (Chan et al.)
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean += delta * count / total
+        self.m2 += m2 + delta * delta * self.count * count / total
+        self.count = total
+
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+        self.buckets += np.bincount(
+            get_bucket_index(values), minlength=BUCKETS)
+
+    @property
+    def stddev(self):
+        if self.count == 0:
+            return math.nan
+        return math.sqrt(self.m2 / self.count)
+
+    def percentile(self, q):
+        if self.count == 0:
+            return math.nan
+        rank = max(math.ceil(self.count * q / 100), 1)
+        index = int(np.searchsorted(np.cumsum(self.buckets), rank))
+        value = get_bucket_value(index)
+        return min(max(value, self.min), self.max)
+
+    def to_dict(self):
+        """
+        return the stats, they are None when no value is added
+        """
+        stat = {'count': self.count}
+        stat['min'] = self.min
+        stat['mean'] = self.mean
+        stat['max'] = self.max
+        stat['stddev'] = self.stddev
+        for q in PERCENTILES:
+            stat['p%d' % q] = self.percentile(q)
+        if self.count == 0:
+            stat.update((key, None) for key in stat if key != 'count')
+        return stat
+
+
+class Summary:
+    """
+    Accumulators of each disk and column
+
+    >>> from datetime import datetime
+    >>> store = StatStore()
+    >>> store.set_device_columns(['r/s', 'w/s'])
+    >>> for sec in range(3):
+    ...     _ = store.add_date(datetime(2018, 6, 13, 14, 10, sec))
+    ...     store.add_device('sda', [1.0, float(sec)])
+    >>> summary = Summary()
+    >>> summary.add(store)
+    >>> summary.to_dict()['sda']['w/s']['max']
+    2.0
+    """
+
+    def __init__(self):
+        self.series = {}
+        self.snapshots = 0
+
+    def get_series(self, name, column):
+        key = (name, column)
+        series = self.series.get(key)
+        if series is None:
+            series = SeriesSummary()
+            self.series[key] = series
+        return series
+
+    def add(self, store):
+        self.snapshots += len(store)
+        if not store.has_device or len(store.device_rows) == 0:
+            return
+        rows, ids, values = store.device_table()
+        # group the entries by disk to fold each series at once
+        order = np.argsort(ids, kind='stable')
+        ids = ids[order]
+        values = values[order]
+        device_ids, starts = np.unique(ids, return_index=True)
+        ends = np.append(starts[1:], len(ids))
+        for device_id, start, end in zip(device_ids, starts, ends):
+            name = store.device_names[device_id]
+            for j, column in enumerate(store.device_columns):
+                self.get_series(name, column).add(values[start:end, j])
+
+    def to_dict(self):
+        disks = {}
+        for (name, column), series in self.series.items():
+            disks.setdefault(name, {})[column] = series.to_dict()
+        return disks
+
+
+def make_store(columns=None):
+    """
+    make a store which keeps only the columns to summarize
+    """
+    if columns is None:
+        columns = get_summary_columns()
+    return StatStore(keep_cpu=False, keep_device_columns=columns)
+
+
+def format_table(summary):
+    header = ['device', 'column', 'count', 'min', 'mean', 'max', 'stddev']
+    header.extend('p%d' % q for q in PERCENTILES)
+    lines = [header]
+    for (name, column), series in summary.series.items():
+        stat = series.to_dict()
+        line = [name, column, str(stat['count'])]
+        line.extend('-' if stat[i] is None else '%.2f' % stat[i]
+                    for i in header[3:])
+        lines.append(line)
+
+    widths = [max(len(line[i]) for line in lines) for i in range(len(header))]
+    text = []
+    for line in lines:
+        fields = [line[0].ljust(widths[0]), line[1].ljust(widths[1])]
+        fields.extend(field.rjust(width)
+                      for field, width in zip(line[2:], widths[2:]))
+        text.append('  '.join(fields).rstrip())
+    return '\n'.join(text)
+
+
+def format_json(summary):
+    return json.dumps({
+        'snapshots': summary.snapshots,
+        'devices': summary.to_dict(),
+    }, indent=2)
+
+
+def summarize_files(args, paths, columns=None):
+    summary = Summary()
+    for path in paths:
+        parser = Parser(get_file_args(args, path), make_store(columns))
+        with stage('parse'):
+            for store in parser.parse_batches(BATCH_ROWS):
+                with stage('summarize'):
+                    summary.add(store)
+    return summary
+
+
+def summarize(args):
+    summary = summarize_files(args, args.data_files)
+
+    if not summary.series:
+        log.error('no device stats to summarize')
+        return
+    if args.format == SUMMARY_FORMAT_JSON:
+        print(format_json(summary))
+    else:
+        print(format_table(summary))
@@ -0,0 +1,65 @@
+from .utils import IOSTAT_DATE_DECODERS
+from .utils import get_iostat_date_format
+from .utils import parse_datetime
+
+DATE = 'date'
+CPU_HEADER = 'cpu_header'
+DEVICE_HEADER = 'device_header'
+OTHER = 'other'
+
+_CPU_HEADER_PREFIX = 'avg-cpu:'
+_DEVICE_HEADER_PREFIX = 'Device'
+
+
+class Tokenizer:
+    """
+    Classify lines outside of stat blocks by their first characters
+
+    The date format is detected with regular expressions only once, then
+    timestamps are decoded with the fixed-width decoder for that format.
+
+    >>> tokenizer = Tokenizer()
+    >>> tokenizer.tokenize('06/13/2018 02:10:50 PM\\n')
+    ('date', datetime.datetime(2018, 6, 13, 14, 10, 50))
+    >>> tokenizer.date_format
+    '%m/%d/%Y %I:%M:%S %p'
+    >>> tokenizer.tokenize('avg-cpu:  %user   %idle\\n')
+    ('cpu_header', ['%user', '%idle'])
+    >>> tokenizer.tokenize('Device:   r/s   w/s\\n')
+    ('device_header', ['r/s', 'w/s'])
+    >>> tokenizer.tokenize('Linux 4.18.0 (localhost)  09/26/21\\n')
+    ('other', 'Linux 4.18.0 (localhost)  09/26/21')
+    """
+
+    def __init__(self):
+        self.date_format = None
+        self.decode_date = None
+
+    def parse_date(self, line):
+        if self.decode_date is not None:
+            date = self.decode_date(line)
+            if date is not None:
+                return date
+
+        date_format = get_iostat_date_format(line)
+        if date_format is None:
+            return None
+        self.date_format = date_format
+        self.decode_date = IOSTAT_DATE_DECODERS.get(date_format)
+        return parse_datetime(line.strip(), fmt=date_format)
+
+    def tokenize(self, line):
+        c = line[:1]
+        if c.isspace():
+            line = line.strip()
+            c = line[:1]
+
+        if c.isdigit():
+            date = self.parse_date(line)
+            if date is not None:
+                return DATE, date
+        elif c == 'a' and line.startswith(_CPU_HEADER_PREFIX):
+            return CPU_HEADER, line.split()[1:]
+        elif c == 'D' and line.startswith(_DEVICE_HEADER_PREFIX):
+            return DEVICE_HEADER, line.split()[1:]
+        return OTHER, line.strip()
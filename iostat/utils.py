@@ -56,6 +56,90 @@ def get_iostat_date_format(s):
     return None
 
 
+IOSTAT_DATE_EN_FIXED = re.compile(
+    r'(\d\d)/(\d\d)/(\d{4}) (\d\d):(\d\d):(\d\d) ([AP])M\s*$'
+)
+IOSTAT_DATE_JA_FIXED = re.compile(
+    r'(\d\d)/(\d\d)/(\d\d) (\d\d):(\d\d):(\d\d)\s*$'
+)
+
+
+def decode_iostat_date_en(s):
+    """
+    >>> decode_iostat_date_en('06/13/2018 02:10:50 PM')
+    datetime.datetime(2018, 6, 13, 14, 10, 50)
+    >>> decode_iostat_date_en('06/13/2018 12:10:50 AM')
+    datetime.datetime(2018, 6, 13, 0, 10, 50)
+    >>> decode_iostat_date_en('09/26/21 13:35:19') is None
+    True
+    """
+    m = IOSTAT_DATE_EN_FIXED.match(s)
+    if m is None:
+        return None
+    month, day, year, hour, minute, second, am_pm = m.groups()
+    hour = int(hour) % 12
+    if am_pm == 'P':
+        hour += 12
+    return datetime(
+        int(year), int(month), int(day), hour, int(minute), int(second))
+
+
+def decode_iostat_date_ja(s):
+    """
+    >>> decode_iostat_date_ja('09/26/21 13:35:19')
+    datetime.datetime(2021, 9, 26, 13, 35, 19)
+    >>> decode_iostat_date_ja('09/26/99 13:35:19')
+    datetime.datetime(1999, 9, 26, 13, 35, 19)
+    >>> decode_iostat_date_ja('06/13/2018 02:10:50 PM') is None
+    True
+    """
+    m = IOSTAT_DATE_JA_FIXED.match(s)
+    if m is None:
+        return None
+    month, day, year, hour, minute, second = m.groups()
+    year = int(year)
+    year += 1900 if year >= 69 else 2000  # same pivot as strptime's %y
+    return datetime(
+        year, int(month), int(day), int(hour), int(minute), int(second))
+
+
+IOSTAT_DATE_DECODERS = {
+    IOSTAT_DATE_FORMAT_EN: decode_iostat_date_en,
+    IOSTAT_DATE_FORMAT_JA: decode_iostat_date_ja,
+}
+
+
+DURATION_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_duration(s):
+    """
+    >>> parse_duration('10s')
+    10
+    >>> parse_duration('5m')
+    300
+    >>> parse_duration('90')
+    90
+    >>> parse_duration('1h')
+    3600
+    """
+    s = s.strip()
+    unit = DURATION_UNITS.get(s[-1:])
+    if unit is None:
+        return int(s)
+    return int(s[:-1]) * unit
+
+
+def format_elapsed(seconds):
+    """
+    >>> format_elapsed(3725), format_elapsed(90061)
+    ('1:02:05', '25:01:01')
+    """
+    seconds = int(round(seconds))
+    hours, seconds = divmod(seconds, 3600)
+    return '%d:%02d:%02d' % (hours, seconds // 60, seconds % 60)
+
+
 def add_suffix_to_name(path, suffix):
     """
     >>> add_suffix_to_name('sample.log', 'test')
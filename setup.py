@@ -42,7 +42,7 @@ setup(
     platforms=['unix', 'linux', 'osx', 'windows'],
     packages=['iostat'],
     include_package_data=True,
-    install_requires=['matplotlib'],
+    install_requires=['matplotlib', 'numpy'],
     tests_require=['tox', 'pytest', 'pytest-pep8', 'pytest-flakes'],
     entry_points={
         'console_scripts': [
@@ -0,0 +1,41 @@
+"""
+Print recorded iostat output as if iostat is running
+
+It stands in for iostat on remote hosts to try monitor without them.
+
+    $ iostat-cli monitor \
+        --source "node1=python tests/fake_iostat.py tests/fixtures/sample_iostat.output" \
+        --source "node2=python tests/fake_iostat.py tests/fixtures/sample_iostat_11.7.3.output"
+"""  # noqa: E501
+import argparse
+import sys
+import time
+
+
+def parse_argument(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('data', help='set path to iostat output file')
+    parser.add_argument(
+        '--interval', type=float, default=1.0,
+        help='set interval in seconds to print each snapshot, default is 1.0'
+    )
+    return parser.parse_args(argv)
+
+
+def main():
+    args = parse_argument()
+    with open(args.data) as f:
+        blocks = f.read().split('\n\n')
+    for i, block in enumerate(blocks):
+        # iostat prints a blank line after each block
+        if i < len(blocks) - 1:
+            block += '\n\n'
+        sys.stdout.write(block)
+        sys.stdout.flush()
+        if 'Device' in block:
+            # device stats are the last in a snapshot
+            time.sleep(args.interval)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+import os
+
+import numpy as np
+
+from iostat.main import parse_argument
+from iostat.parser import Parser
+from iostat.plotter import make_store
+from iostat.store import StatStore
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+LEGACY = os.path.join(FIXTURES, 'sample_iostat.output')
+SYSSTAT_11_7 = os.path.join(FIXTURES, 'sample_iostat_11.7.3.output')
+
+
+def load(*paths):
+    argv = []
+    for path in paths:
+        argv.extend(['--data', path])
+    return Parser(parse_argument(argv + ['csv'])).load()
+
+
+def test_load_files_with_mixed_headers():
+    legacy = load(LEGACY)
+    new = load(SYSSTAT_11_7)
+    store = load(LEGACY, SYSSTAT_11_7)
+
+    assert len(store) == len(legacy) + len(new)
+    assert store.cpu_columns == legacy.cpu_columns
+    columns = store.device_columns
+    assert set(columns) == set(legacy.device_columns + new.device_columns)
+
+    # the legacy output comes first and has no value of the new columns
+    rows, _, values = store.device_table()
+    legacy_values = values[rows < len(legacy)]
+    assert len(legacy_values) == len(legacy.device_rows)
+    assert np.isnan(legacy_values[:, columns.index('aqu-sz')]).all()
+    new_values = values[rows >= len(legacy)]
+    assert np.isnan(new_values[:, columns.index('await')]).all()
+    assert np.array_equal(
+        new_values[:, columns.index('r_await')],
+        new.device_table()[2][:, new.device_columns.index('r_await')])
+
+
+def test_extend_projected_store():
+    legacy = load(LEGACY)
+    new = load(SYSSTAT_11_7)
+    store = StatStore(keep_cpu=False, keep_device_columns=['r/s', 'aqu-sz'])
+    store.extend(legacy)
+    store.extend(new)
+
+    assert store.cpu_columns is None
+    assert store.device_columns == ['r/s', 'aqu-sz']
+    values = store.device_table()[2]
+    assert values.shape == (len(store.device_rows), 2)
+    assert np.isnan(values[:len(legacy.device_rows), 1]).all()
+
+
+def test_load_projected_store(tmp_path):
+    for options in [[], ['--jobs', '2'], ['--cache-dir', str(tmp_path)]]:
+        args = parse_argument(
+            ['--data', LEGACY, 'plot', '--subplots', 'iops', '--without-cpu']
+            + options)
+        store = Parser(args, make_store(args)).load()
+        assert store.cpu_columns is None
+        assert store.device_columns == ['r/s', 'w/s']
@@ -0,0 +1,99 @@
+import gzip
+import os
+import shutil
+import subprocess
+import sys
+
+import numpy as np
+
+from iostat.index import get_index_path
+from iostat.main import parse_argument
+from iostat.parser import Parser
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURE = os.path.join(ROOT, 'tests', 'fixtures', 'sample_iostat.output')
+CRLF_FIXTURE = os.path.join(
+    ROOT, 'tests', 'fixtures', 'sample_iostat_crlf.output')
+
+
+def load(path, *options):
+    args = parse_argument([
+        '--data', path,
+        '--since', '20180613141100', '--until', '20180613141130',
+        'csv',
+    ] + list(options))
+    parser = Parser(args)
+    return parser, parser.load()
+
+
+def test_index_is_opt_in(tmp_path):
+    path = str(tmp_path / 'iostat.output')
+    shutil.copy(FIXTURE, path)
+    load(path)
+    assert not os.path.exists(get_index_path(path))
+    load(path, '--index')
+    assert os.path.exists(get_index_path(path))
+
+
+def test_index_gives_same_result(tmp_path):
+    path = str(tmp_path / 'iostat.output')
+    shutil.copy(FIXTURE, path)
+    parser, store = load(path)
+    for options in [['--index'], ['--index', '--mmap'],
+                    ['--index', '--jobs', '2']]:
+        indexed_parser, indexed = load(path, *options)
+        assert indexed_parser.extra_lines == parser.extra_lines
+        assert indexed_parser.extra_lines[0].startswith('Linux ')
+        assert np.array_equal(indexed.timestamps(), store.timestamps())
+        assert np.array_equal(
+            indexed.cpu_matrix(), store.cpu_matrix(), equal_nan=True)
+        for expected, actual in zip(store.device_table(),
+                                    indexed.device_table()):
+            assert np.array_equal(expected, actual)
+
+
+def test_index_on_read_only_directory(tmp_path, monkeypatch):
+    path = str(tmp_path / 'iostat.output')
+    shutil.copy(FIXTURE, path)
+    _, store = load(path)
+
+    def save(self, index_path):
+        raise PermissionError('read-only file system')
+    monkeypatch.setattr('iostat.index.TimestampIndex.save', save)
+    _, indexed = load(path, '--index')
+    assert not os.path.exists(get_index_path(path))
+    assert np.array_equal(indexed.timestamps(), store.timestamps())
+
+
+def test_index_is_not_used_for_crlf(tmp_path):
+    path = str(tmp_path / 'iostat.output')
+    shutil.copy(CRLF_FIXTURE, path)
+    argv = ['--data', path, '--since', '20180613141051', 'csv']
+    store = Parser(parse_argument(argv)).load()
+    assert len(store) > 0
+    indexed = Parser(parse_argument(argv + ['--index'])).load()
+    assert not os.path.exists(get_index_path(path))
+    assert np.array_equal(indexed.timestamps(), store.timestamps())
+
+
+def test_index_subcommand_indexes_all_files(tmp_path):
+    paths = [str(tmp_path / name) for name in ['a.output', 'b.output']]
+    for path in paths:
+        shutil.copy(FIXTURE, path)
+    gzipped = str(tmp_path / 'c.output.gz')
+    with open(FIXTURE, 'rb') as src, gzip.open(gzipped, 'wb') as dst:
+        shutil.copyfileobj(src, dst)
+    crlf = str(tmp_path / 'd.output')
+    shutil.copy(CRLF_FIXTURE, crlf)
+
+    result = subprocess.run(
+        [sys.executable, '-m', 'iostat.main',
+         '--data', str(tmp_path / '*.output'), '--data', gzipped, 'index'],
+        cwd=ROOT, capture_output=True, text=True, timeout=120,
+    )
+    assert result.returncode == 0, result.stderr
+    for path in paths:
+        assert os.path.exists(get_index_path(path))
+    for path in [gzipped, crlf]:
+        assert not os.path.exists(get_index_path(path))
+        assert path in result.stderr
@@ -0,0 +1,87 @@
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FAKE_IOSTAT = os.path.join(ROOT, 'tests', 'fake_iostat.py')
+FIXTURES = {
+    'node1': os.path.join(ROOT, 'tests', 'fixtures', 'sample_iostat.output'),
+    'node2': os.path.join(
+        ROOT, 'tests', 'fixtures', 'sample_iostat_11.7.3.output'),
+}
+
+
+def read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def start_monitor(tmp_path, interval):
+    argv = [
+        sys.executable, '-m', 'iostat.main',
+        '--output', str(tmp_path / 'iostat.log'),
+        '--fig-output', str(tmp_path / 'iostat.png'),
+        'monitor',
+    ]
+    for tag, path in FIXTURES.items():
+        argv.extend(['--source', '%s=%s %s %s --interval %s' % (
+            tag, sys.executable, FAKE_IOSTAT, path, interval)])
+    return subprocess.Popen(
+        argv, cwd=ROOT, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+
+def test_monitor_sources(tmp_path):
+    process = start_monitor(tmp_path, 0)
+    stdout, stderr = process.communicate(timeout=120)
+    assert process.returncode == 0, stderr.decode()
+    assert b'Traceback' not in stderr
+
+    lines = stdout.decode().splitlines()
+    for tag, path in FIXTURES.items():
+        # each source is saved in its own file
+        assert read(str(tmp_path / ('iostat_%s.log' % tag))) == read(path)
+        # and echoed with its tag
+        echoed = [line for line in lines if line.startswith('[%s]' % tag)]
+        assert len(echoed) == read(path).count(b'\n')
+    # all sources are rendered in one figure
+    assert os.path.getsize(str(tmp_path / 'iostat.png')) > 0
+
+
+def test_monitor_sources_interrupted(tmp_path):
+    process = start_monitor(tmp_path, 0.05)
+    log_path = str(tmp_path / 'iostat_node1.log')
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        if os.path.exists(log_path) and os.path.getsize(log_path) > 0:
+            break
+        time.sleep(0.1)
+    process.send_signal(signal.SIGINT)
+    stdout, stderr = process.communicate(timeout=120)
+    assert process.returncode == 0, stderr.decode()
+    assert b'Traceback' not in stderr
+    assert b'Event loop is closed' not in stderr
+
+    lines = stdout.decode().splitlines()
+    for tag, path in FIXTURES.items():
+        saved = read(str(tmp_path / ('iostat_%s.log' % tag)))
+        assert read(path).startswith(saved)
+        # the lines read before the interrupt are both saved and echoed
+        echoed = [line for line in lines if line.startswith('[%s]' % tag)]
+        assert len(echoed) == saved.count(b'\n')
+    assert os.path.getsize(str(tmp_path / 'iostat.png')) > 0
+
+
+def test_monitor_replay_to_same_output(tmp_path):
+    path = str(tmp_path / 'iostat.log')
+    shutil.copy(FIXTURES['node1'], path)
+    result = subprocess.run([
+        sys.executable, '-m', 'iostat.main',
+        '--output', path, '--fig-output', str(tmp_path / 'iostat.png'),
+        'monitor', '--replay', path, '--speed', '0',
+    ], cwd=ROOT, capture_output=True, timeout=120)
+    assert result.returncode == 0, result.stderr.decode()
+    assert b'replayed file is also the output' in result.stderr
+    assert read(path) == read(FIXTURES['node1'])
@@ -0,0 +1,110 @@
+import os
+import random
+
+import numpy as np
+import pytest
+
+from iostat.main import parse_argument
+from iostat.parallel import parse_chunk
+from iostat.parser import Parser
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+
+def get_fixture(name):
+    return os.path.join(FIXTURES, name)
+
+
+def test_parse_line_keeps_store_bounded():
+    args = parse_argument(['monitor'])
+    parser = Parser(args)
+    with open(get_fixture('sample_iostat.output')) as f:
+        lines = f.readlines()
+
+    stats = []
+    sizes = []
+    for _ in range(5):
+        for line in lines:
+            stats.extend(parser.parse_line(line))
+            sizes.append(len(parser.store))
+    stats.extend(parser.store.get_stat(row) for row in parser.flush())
+
+    assert len(stats) == 318 * 5
+    assert max(sizes) == 1
+    assert stats[0]['device']['stats'] == stats[318]['device']['stats']
+
+
+FIXTURE_NAMES = sorted(
+    name for name in os.listdir(FIXTURES) if name.endswith('.output'))
+
+
+def load(path, *options):
+    parser = Parser(parse_argument(['--data', path, 'csv'] + list(options)))
+    store = parser.load()
+    return store, parser.extra_lines
+
+
+def parse_appended(path, tmp_path, seed):
+    """
+    parse the file while writing it in chunks of random sizes
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    follow_path = str(tmp_path / os.path.basename(path))
+    parser = Parser(parse_argument(['--data', follow_path, 'csv']))
+    rng = random.Random(seed)
+    with open(follow_path, 'wb') as f:
+        written = 0
+        while written < len(data):
+            size = rng.randint(1, 4096)
+            f.write(data[written:written + size])
+            f.flush()
+            written += size
+            for _ in parser.parse_appended():
+                pass
+    for _ in parser.flush():
+        pass
+    return parser.store, parser.extra_lines
+
+
+def assert_same(expected, actual):
+    expected_store, expected_lines = expected
+    store, lines = actual
+    assert lines == expected_lines
+    assert store.cpu_columns == expected_store.cpu_columns
+    assert store.device_columns == expected_store.device_columns
+    assert store.device_names == expected_store.device_names
+    assert np.array_equal(store.timestamps(), expected_store.timestamps())
+    if expected_store.has_cpu:
+        assert np.array_equal(
+            store.cpu_matrix(), expected_store.cpu_matrix(), equal_nan=True)
+    for values, expected_values in zip(store.device_table(),
+                                       expected_store.device_table()):
+        assert np.array_equal(values, expected_values, equal_nan=True)
+
+
+@pytest.mark.parametrize('name', FIXTURE_NAMES)
+def test_parse_paths_give_same_stats(name, tmp_path):
+    path = get_fixture(name)
+    expected = load(path)
+    assert len(expected[0]) > 0
+
+    assert_same(expected, load(path, '--mmap'))
+    assert_same(expected, load(path, '--jobs', '2'))
+    assert_same(expected, load(path, '--jobs', '3'))
+    cache_dir = str(tmp_path / 'cache')
+    # parse and cache the snapshots, then load them from the cache
+    assert_same(expected, load(path, '--cache-dir', cache_dir))
+    assert os.listdir(cache_dir)
+    assert_same(expected, load(path, '--cache-dir', cache_dir))
+    for seed in range(3):
+        assert_same(expected, parse_appended(path, tmp_path, seed))
+
+
+def test_parse_chunk_keeps_projection():
+    path = get_fixture('sample_iostat.output')
+    args = parse_argument(['--data', path, 'csv'])
+    store, _ = parse_chunk(args, 0, os.path.getsize(path), False, ['r/s'])
+    assert store.cpu_columns is None
+    assert store.device_columns == ['r/s']
+    assert store.device_table()[2].shape == (3498, 1)
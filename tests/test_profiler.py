@@ -0,0 +1,90 @@
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURE = os.path.join(ROOT, 'tests', 'fixtures', 'sample_iostat.output')
+
+
+def run_cli(*argv):
+    return subprocess.run(
+        [sys.executable, '-m', 'iostat.main'] + list(argv),
+        cwd=ROOT, capture_output=True, text=True, timeout=120,
+    )
+
+
+def get_report(stderr):
+    """
+    return {stage: seconds} and the other lines of the report
+    """
+    lines = stderr[stderr.index('profile:\n'):].splitlines()[2:]
+    stages = {}
+    for line in lines:
+        name, *values = line.split()
+        stages[name] = float(values[0])
+        if name == 'total':
+            break
+    return stages, lines[len(stages):]
+
+
+def test_profile_plot(tmp_path):
+    result = run_cli(
+        '--profile', '--data', FIXTURE,
+        '--fig-output', str(tmp_path / 'plot.png'), 'plot')
+    assert result.returncode == 0, result.stderr
+    stages, lines = get_report(result.stderr)
+
+    assert list(stages) == ['parse', 'plot', 'savefig', 'other', 'total']
+    assert all(stages[i] > 0 for i in ['parse', 'plot', 'savefig'])
+    assert stages['total'] >= sum(stages[i] for i in ['parse', 'plot'])
+    assert lines[0].startswith(
+        'input: 0.5 MiB, 318 snapshots, 3498 device records')
+    assert lines[1].startswith('peak rss: ')
+
+
+def test_profile_output(tmp_path):
+    import pstats
+    output = tmp_path / 'summary.pstats'
+    result = run_cli(
+        '--profile-output', str(output), '--data', FIXTURE, 'summary')
+    assert result.returncode == 0, result.stderr
+    stages, _ = get_report(result.stderr)
+    assert list(stages) == ['parse', 'summarize', 'other', 'total']
+    assert pstats.Stats(str(output)).total_calls > 0
+
+
+def test_profile_missing_data(tmp_path):
+    result = run_cli(
+        '--profile', '--data', str(tmp_path / 'missing.output'), 'summary')
+    assert result.returncode == 0, result.stderr
+    assert 'target file is not found' in result.stderr
+    assert 'Traceback' not in result.stderr
+    stages, _ = get_report(result.stderr)
+    assert stages['total'] > 0
+
+
+def get_input(stderr):
+    _, lines = get_report(stderr)
+    return lines[0].split(' (')[0]
+
+
+def test_profile_counts_records_once(tmp_path):
+    other = os.path.join(
+        ROOT, 'tests', 'fixtures', 'sample_iostat_11.7.3.output')
+    output = str(tmp_path / 'iostat.csv')
+    result = run_cli(
+        '--profile', '--data', FIXTURE, '--data', other,
+        '--output', output, 'csv')
+    assert result.returncode == 0, result.stderr
+    assert get_input(result.stderr) == (
+        'input: 0.5 MiB, 400 snapshots, 3580 device records')
+
+    # a cache miss parses the file in the load
+    cache_dir = str(tmp_path / 'cache')
+    for _ in range(2):
+        result = run_cli(
+            '--profile', '--data', FIXTURE, '--output', output, 'csv',
+            '--cache-dir', cache_dir)
+        assert result.returncode == 0, result.stderr
+        assert get_input(result.stderr).endswith(
+            ', 318 snapshots, 3498 device records')
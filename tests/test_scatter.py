@@ -0,0 +1,64 @@
+import os
+
+import matplotlib
+
+from iostat.main import parse_argument
+from iostat.parser import Parser
+from iostat.ring import History
+
+FIXTURE = os.path.join(
+    os.path.dirname(__file__), 'fixtures', 'sample_iostat.output')
+
+
+class Clock:
+
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_scatter(monkeypatch, clock, draw_time):
+    matplotlib.use('Agg')
+    from iostat.scatter import Scatter
+    monkeypatch.setattr('iostat.scatter.time.monotonic', clock)
+    args = parse_argument(['monitor', '--redraw-interval', '1.0'])
+    scatter = Scatter(args, {None: History(*args.window)}, live=True)
+    update_lines = scatter.update_lines
+
+    def slow_update_lines():
+        update_lines()
+        clock.now += draw_time
+    monkeypatch.setattr(scatter, 'update_lines', slow_update_lines)
+    return scatter
+
+
+def test_live_redraw_interval(monkeypatch):
+    stats = list(Parser(parse_argument(['--data', FIXTURE, 'csv'])).parse())
+    clock = Clock()
+    # drawing takes a half of the redraw interval
+    scatter = make_scatter(monkeypatch, clock, 0.5)
+
+    # a snapshot every second is drawn every time
+    for i, stat in enumerate(stats[:3]):
+        clock.now = 100.0 + i
+        scatter.scatter(stat)
+        assert scatter.drawn_at == clock.now - 0.5
+    assert not scatter.dirty
+    assert scatter.get_redraw_timeout() == 1.0
+
+    # a snapshot in the interval is drawn when the interval passes
+    clock.now = 102.7
+    scatter.scatter(stats[3])
+    assert scatter.drawn_at == 102.0
+    assert scatter.dirty
+    assert abs(scatter.get_redraw_timeout() - 0.3) < 1e-9
+    clock.now = 103.0
+    scatter.redraw_pending()
+    assert scatter.drawn_at == 103.0
+    assert not scatter.dirty
+
+    # nothing is redrawn without a pending snapshot
+    scatter.redraw_pending()
+    assert scatter.drawn_at == 103.0